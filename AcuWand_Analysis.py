@@ -23,6 +23,9 @@ import numpy as np
 from decimal import Decimal
 import statistics
 import math
+from AcuWand_Tools import (find_duplicate_parts, boundary_overlap, write_table, write_samples, chunked_day_stats,
+                           treatment_sessions, glob_data, open_data, hampel_outliers, pressure_stats, cutoff_mask,
+                           format_fallback, glob_folders, not_folders)
 
 __author__ = "Noah C Waller"
 __copyright__ = "Copyright Pending"
@@ -38,6 +41,20 @@ __status__ = "Production"
 study_name='study_name' #specify study name
 calcpressurestats = 1 #use 1 to calculate the min, max, and mean pressure per day
 calctotaltreatment = 1 #use 1 to calculate the total treatment time per day
+removeduplicates = 1 #use 1 to exclude duplicate .csv parts of a date before merging and log part boundary overlaps
+output_format = 'csv' #result file format: 'csv', 'csv.gz', 'parquet', 'feather' (Parquet/Feather need pyarrow, else .csv.gz)
+savecleaned = 0 #use 1 to save cleaned (cutoff-filtered) pressure samples per day, partitioned by T and subject
+splitlargedays = 0 #use 1 to parse and reduce very large merged days in parallel chunks (same results as single-threaded)
+largeday_mb = 100 #merged days larger than this many megabytes are split when splitlargedays = 1
+split_workers = os.cpu_count() #number of parallel workers used to split a large day
+calccounts = 1 #use 1 to add per-date counts of samples below/above the cutoffs, NaN (non-numeric), and kept (blank lines skipped)
+calcsessions = 0 #use 1 to segment each day into treatment sessions (per-session results and per-day session counts)
+session_gap_sec = 30 #idle or empty gap (seconds) that ends a treatment session
+session_min_sec = 10 #treatment sessions shorter than this (seconds) are ignored
+filterartifacts = 0 #use 1 to remove short in-range pressure spikes (rolling-median/Hampel filter) before pressure stats
+hampel_window = 21 #number of samples in the centred rolling window of the artifact filter (21 = 2.1 seconds)
+hampel_threshold = 3 #samples further than this many scaled MADs from the window median are removed as artifacts
+hampel_min_dev = 0.5 #samples are only removed when also further than this pressure difference from the window median
 lower_cutoff = -10 #define lower floor cutoff for pressure calculations
 upper_cutoff = 10 #define upper ceiling cutoff for pressure calculations
 lower_range_fordel = -0.1 #define lower end of range of values to remove consecutive appearances
@@ -48,6 +65,7 @@ logfilename = study_name+'_analysis_log_'+dateandtime+'.txt' #name log file here
 ##### DIRECTORIES BELOW #####
 data_dir = pathjoin(sep) #define input data directory
 log_dir = pathjoin(data_dir) #define output directory to save log file output
+cleaned_dir = pathjoin(log_dir, study_name+'_cleaned_'+dateandtime) #define output directory for cleaned samples (savecleaned = 1)
 
 
 ##### PROGRAM BODY BELOW #####
@@ -60,12 +78,27 @@ logfile.write('\n'+'\n'+'##############################'+"\n"+
               'Please Contact Noah Waller at ncwaller@umich.edu for Errors/Issues'+'\n'+
               '##############################'+'\n'+'\n')
 logfile.close()
+output_notes = [format_fallback(output_format)[1]] #note when result tables or cleaned samples fall back to another format
+if savecleaned == 1:
+    output_notes.append(format_fallback(output_format, table=False)[1])
+for output_note in output_notes:
+    if output_note != '':
+        logfile = open(pathjoin(log_dir,logfilename),'a')
+        logfile.write('Output Format Note: '+output_note+'\n'+'\n')
+        logfile.close()
 
-T_list = glob(pathjoin(data_dir, 'T*')) #grab list of all T# directories
+T_list = glob_folders(data_dir, 'T*') #grab list of all T# directories (and zipped T# folders)
+for path in not_folders(data_dir, 'T*'): #e.g. a damaged T#.zip or a stray T# file
+    logfile = open(pathjoin(log_dir,logfilename),'a')
+    logfile.write('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+    logfile.close()
 for folder in T_list:
     T_ID = folder.split('/')[-1]
-    subjects_list = glob(pathjoin(data_dir, T_ID, 'BPCR01*')) #create subject list
-    subjects_list.sort()
+    subjects_list = glob_folders(pathjoin(data_dir, T_ID), 'BPCR01*') #create subject list (incl. zipped ones)
+    for path in not_folders(pathjoin(data_dir, T_ID), 'BPCR01*'):
+        logfile = open(pathjoin(log_dir,logfilename),'a')
+        logfile.write('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+        logfile.close()
     subjects = []
     outfilename_pressure_bydate = study_name+'_'+T_ID+'_pressure_resultsbydate_'+dateandtime+'.csv' #name output file here
     outfilename_pressure_bysubj = study_name+'_'+T_ID+'_pressure_resultsbysubj_'+dateandtime+'.csv' #name output file here
@@ -73,6 +106,7 @@ for folder in T_list:
     outfilename_txtime_bysubj = study_name+'_'+T_ID+'_txtime_resultsbysubj_'+dateandtime+'.csv' #name output file here
     outfilename_final_bydate = study_name+'_'+T_ID+'_resultsbydate_'+dateandtime+'.csv' #name output file here
     outfilename_final_bysubj = study_name+'_'+T_ID+'_resultsbysubj_'+dateandtime+'.csv' #name output file here
+    outfilename_sessions = study_name+'_'+T_ID+'_sessions_'+dateandtime+'.csv' #name output file here
     for subj in subjects_list:
         subjects.append(subj.split('/')[-1])
     subjects = str(subjects)
@@ -88,6 +122,8 @@ for folder in T_list:
                   'Range for Consecutive Pressure Value Removal Around Zero: '+lower_range_fordel_str+
                   '/+'+upper_range_fordel_str+'\n'+'\n')
     logfile.close()
+    largeday_results = {} #chunked results of large days, shared by the pressure and treatment time stages
+    part_rows = {} #_full.csv path -> rows where each later part begins (every part boundary ends a treatment session)
 
 
 ### PREPARE .CSV FILES (MERGE)
@@ -114,9 +150,9 @@ for folder in T_list:
         # "STUDYNAME03-0512-001_T7_1-18-79.csv" or "STUDYNAME03-0512-001_T7_1-18-79_part1.csv"
         # "STUDYNAME03-####-subject#_T#_date#-date#-date#_part#.csv"
 
-        day_list_format1 = glob(pathjoin(subject_dir, '*'+'_'+'*'+'_'+'*'+'-'+'*'+'-'+'*'+'_'+'*'+'_'+'*.csv')) #reads .csv file in Format 1..
-        day_list_format2 = glob(pathjoin(subject_dir, '*'+'_'+'*'+'___'+'*'+'-'+'*'+'-'+'*'+'___'+'*'+'___'+'*'+'_'+'*.csv')) #reads .csv file in Format 2
-        day_list_format3 = glob(pathjoin(subject_dir, '*'+T_ID+'_'+'*'+'-'+'*'+'-'+'*.csv')) #reads .csv file in Format 3
+        day_list_format1 = glob_data(subject_dir, '*'+'_'+'*'+'_'+'*'+'-'+'*'+'-'+'*'+'_'+'*'+'_'+'*.csv') #reads .csv file in Format 1..
+        day_list_format2 = glob_data(subject_dir, '*'+'_'+'*'+'___'+'*'+'-'+'*'+'-'+'*'+'___'+'*'+'___'+'*'+'_'+'*.csv') #reads .csv file in Format 2
+        day_list_format3 = glob_data(subject_dir, '*'+T_ID+'_'+'*'+'-'+'*'+'-'+'*.csv') #reads .csv file in Format 3
 
         if len(day_list_format3) != 0: #Format 3 is the most stringent, start here: if there is data for a given subject, assign Format 3
             format_style = 3 #assign Format 3
@@ -234,14 +270,34 @@ for folder in T_list:
                 merge_day_name = merge_day_name.replace("_part1_graph","")
             if merge_day_name.endswith("_Part1"):
                 merge_day_name = merge_day_name.replace("_Part1","") #interesting way to handle this
+            if removeduplicates == 1: #exclude identical uploads (e.g. '_part1' and '_part 1' copies) before merging
+                list_v, duplicate_pairs = find_duplicate_parts(list_v)
+                for pair in duplicate_pairs:
+                    logfile = open(pathjoin(log_dir,logfilename),'a')
+                    logfile.write('Duplicate File for '+subj_name+': '+pair[0].split('/')[-1]+' is identical to '
+                                  +pair[1].split('/')[-1]+'... excluded from merge.'+"\n"+"\n")
+                    logfile.close()
+                for prev_part, next_part in zip(list_v[:-1], list_v[1:]): #check where consecutive parts meet
+                    overlap_rows = boundary_overlap(prev_part, next_part)
+                    if overlap_rows > 0:
+                        logfile = open(pathjoin(log_dir,logfilename),'a')
+                        logfile.write('Partial Overlap for '+subj_name+': last '+str(overlap_rows)+' rows of '
+                                      +prev_part.split('/')[-1]+' repeat at start of '+next_part.split('/')[-1]
+                                      +'... check participant log, rows were not removed.'+"\n"+"\n")
+                        logfile.close()
             merge_df = pd.DataFrame() #creates DF for .csv files to be merged
+            part_lengths = []
             for f in list_v:
-                df = pd.read_csv(f)
+                with open_data(f) as handle: #streams compressed and archived parts straight into the parser
+                    df = pd.read_csv(handle)
+                part_lengths.append(len(df))
                 df = df[df.columns[0]] #takes first column from the frame (some .csv files have multiple empty columns)
                 df.columns=[0] #changes index to zero (results in slightly changed data, minimal impact)
                 merge_df = pd.concat([merge_df, df]) 
+            os.makedirs(subject_dir, exist_ok=True) #a zipped subject folder gets a real folder for its _full.csv files
             os.chdir(subject_dir)
             merge_df.to_csv(merge_day_name+"_full.csv", index=False, encoding='utf-8-sig')
+            part_rows[pathjoin(subject_dir, merge_day_name+"_full.csv")] = np.cumsum(part_lengths)[:-1]
             #NOTE: this outputs a .csv file to the given subject directory for each date; this will be output 
             #even if there were not multiple parts - it will just consist of the original .csv file for the date
 
@@ -253,6 +309,11 @@ for folder in T_list:
         #logfile.close()
         df_full = pd.DataFrame()
         df_overall = pd.DataFrame()
+        list_sessions = [] #one row per treatment session (calcsessions = 1)
+        list_daysessions = [] #number of treatment sessions per date, in result row order
+        list_daysartifacts = [] #number of samples removed by the artifact filter per date, in result row order
+        list_daycounts = [] #[below, above, NaN, kept] sample counts per date, in result row order
+        list_daystats = [] #[max, mean, median, skew, kurtosis, sd] as numbers per date, in result row order (non-CSV formats)
         for subject_dir in subjects_list:
             day_list = glob(pathjoin(subject_dir, '*_full.csv'))
             day_list.sort()
@@ -275,18 +336,67 @@ for folder in T_list:
                 day_name = day.split('/')[-1].replace("_full.csv","") #get subj/day name
                 full_name = subj_name_strip+'_'+day_name
                 list_subjday.append(full_name)
-                column_list = [0]
-                df = pd.read_csv(day, usecols=column_list)
-                df.columns = ["Pressure"] #read in .csv file, take only the first column, rename it to "Pressure"
-                df_chopmin = df[df.Pressure > lower_cutoff] #remove lower values
-                df_chopboth = df_chopmin[df_chopmin.Pressure < upper_cutoff] #remove upper values
-                day_min = df_chopboth.min() #calculate min pressure value
-                day_max = df_chopboth.max() #calculate max pressure value
-                day_mean = df_chopboth.mean() #calculate mean pressure value
-                day_median = df_chopboth.median() #calculation median pressure value
-                day_skew = df_chopboth.skew() #calculate skewness
-                day_kurtosis = df_chopboth.kurtosis() - 3 #calculate kurtosis
-                day_sd = df_chopboth.std() #calculate standard deviation   
+                if splitlargedays == 1 and os.path.getsize(day) > largeday_mb*1e6: #parse and reduce large days in parallel chunks
+                    if day not in largeday_results:
+                        largeday_results[day] = chunked_day_stats(day, lower_cutoff, upper_cutoff, split_workers,
+                                                                  keep_samples=(savecleaned == 1 or filterartifacts == 1),
+                                                                  keep_values=(calcsessions == 1), threshold=600)
+                    day_result = largeday_results[day]
+                    list_daycounts.append([day_result['below'], day_result['above'], day_result['nan'], day_result['count']])
+                    day_values = day_result['values']
+                    day_result['values'] = None
+                    if filterartifacts == 1: #remove in-range spikes, then recompute the stats from the remaining samples
+                        artifacts = hampel_outliers(day_result['samples'], hampel_window, hampel_threshold, hampel_min_dev)
+                        day_result['samples'] = day_result['samples'][~artifacts]
+                        day_result.update(pressure_stats(day_result['samples']))
+                        list_daysartifacts.append(int(artifacts.sum()))
+                    if savecleaned == 1:
+                        os.makedirs(pathjoin(cleaned_dir, T_ID, subj_name_strip), exist_ok=True)
+                        write_samples(day_result['samples'], pathjoin(cleaned_dir, T_ID, subj_name_strip, day_name+'.csv'),
+                                      output_format)
+                    day_result['samples'] = None
+                    day_min = pd.Series([day_result['min']], index=['Pressure']) #same layout as the pandas reductions below
+                    day_max = pd.Series([day_result['max']], index=['Pressure'])
+                    day_mean = pd.Series([day_result['mean']], index=['Pressure'])
+                    day_median = pd.Series([day_result['median']], index=['Pressure'])
+                    day_skew = pd.Series([day_result['skew']], index=['Pressure'])
+                    day_kurtosis = pd.Series([day_result['kurtosis']], index=['Pressure']) - 3
+                    day_sd = pd.Series([day_result['sd']], index=['Pressure'])
+                    if day_result['count'] == 0:
+                        day_IQR = str('NaN') #if no values remain, needs special intervention
+                    else:
+                        day_IQR = day_result['Q3'] - day_result['Q1'] #calculate interquartile range
+                else:
+                    column_list = [0]
+                    df = pd.read_csv(day, usecols=column_list)
+                    df.columns = ["Pressure"] #read in .csv file, take only the first column, rename it to "Pressure"
+                    df["Pressure"] = pd.to_numeric(df.Pressure, errors='coerce') #non-numeric rows become NaN (never kept)
+                    day_values = df.Pressure.to_numpy()
+                    keep, day_counts = cutoff_mask(day_values, lower_cutoff, upper_cutoff) #one mask for both cutoffs, with counts
+                    df_chopboth = df[keep] #remove lower values, upper values, and NaN rows
+                    list_daycounts.append([day_counts['below'], day_counts['above'], day_counts['nan'], day_counts['kept']])
+                    if filterartifacts == 1: #remove in-range spikes (rolling-median/Hampel filter)
+                        artifacts = hampel_outliers(df_chopboth.Pressure.to_numpy(), hampel_window, hampel_threshold,
+                                                    hampel_min_dev)
+                        df_chopboth = df_chopboth[~artifacts]
+                        list_daysartifacts.append(int(artifacts.sum()))
+                    if savecleaned == 1: #save cleaned samples as cleaned_dir/T#/subject/day.<format> in the result output format
+                        os.makedirs(pathjoin(cleaned_dir, T_ID, subj_name_strip), exist_ok=True)
+                        write_samples(df_chopboth.Pressure, pathjoin(cleaned_dir, T_ID, subj_name_strip, day_name+'.csv'),
+                                      output_format)
+                    day_min = df_chopboth.min() #calculate min pressure value
+                    day_max = df_chopboth.max() #calculate max pressure value
+                    day_mean = df_chopboth.mean() #calculate mean pressure value
+                    day_median = df_chopboth.median() #calculation median pressure value
+                    day_skew = df_chopboth.skew() #calculate skewness
+                    day_kurtosis = df_chopboth.kurtosis() - 3 #calculate kurtosis
+                    day_sd = df_chopboth.std() #calculate standard deviation   
+                    if df_chopboth.empty:
+                        day_IQR = str('NaN') #if dataframe is empty, needs special intervention
+                    elif not df_chopboth.empty:
+                        day_Q3 = np.quantile(df_chopboth, 0.75) #calculate third quartile cutoff
+                        day_Q1 = np.quantile(df_chopboth, 0.25) #calculate first quartile cufoff
+                        day_IQR = day_Q3 - day_Q1 #calculate interquartile range
                 day_min_str = str(day_min)
                 day_max_str = str(day_max)
                 day_mean_str = str(day_mean)
@@ -298,13 +408,16 @@ for folder in T_list:
                     list_m_mean.append(day_mean)
                 if math.isnan(day_sd) == False:
                     list_m_sd.append(day_sd)
-                if df_chopboth.empty:
-                    day_IQR = str('NaN') #if dataframe is empty, needs special intervention
-                elif not df_chopboth.empty:
-                    day_Q3 = np.quantile(df_chopboth, 0.75) #calculate third quartile cutoff
-                    day_Q1 = np.quantile(df_chopboth, 0.25) #calculate first quartile cufoff
-                    day_IQR = day_Q3 - day_Q1 #calculate interquartile range
                 day_IQR_str = str(day_IQR)
+                if calcsessions == 1: #split the day into treatment sessions at idle/empty gaps
+                    day_sessions = treatment_sessions(day_values, lower_cutoff, upper_cutoff, lower_range_fordel,
+                                                      upper_range_fordel, session_gap_sec, session_min_sec,
+                                                      part_rows.get(day, ())) #start_sec counts from the merged file
+                    for k in range(len(day_sessions['start_sec'])):
+                        list_sessions.append([full_name, k+1, day_sessions['start_sec'][k], day_sessions['duration_sec'][k],
+                                              day_sessions['duration_sec'][k]/60, day_sessions['active_sec'][k],
+                                              day_sessions['max'][k], day_sessions['mean'][k], day_sessions['sd'][k]])
+                    list_daysessions.append(len(day_sessions['start_sec']))
                 #logfile = open(pathjoin(log_dir,logfilename),'a') #report pressure statistics for subject date in log file
                 #logfile.write(day_name+':'+ "\n"
                 #              +'Minimum '+day_min_str+"\n"+'Maximum '+day_max_str+"\n"
@@ -320,6 +433,8 @@ for folder in T_list:
                 list_subjkurtosis.append(day_kurtosis_str)
                 list_subjsd.append(day_sd_str)
                 list_subjIQR.append(day_IQR_str)           
+                list_daystats.append([day_max.iloc[0], day_mean.iloc[0], day_median.iloc[0], day_skew.iloc[0],
+                                      day_kurtosis.iloc[0], day_sd.iloc[0]]) #the strings above are printed to 6 decimals
                 ### 
             if len(day_list) != 0:
                 df_subjday = pd.DataFrame(list(zip(list_subjday))) #dataframe of subject and days  
@@ -380,6 +495,10 @@ for folder in T_list:
             df_overall_frames = [df_overall, overall_result]
             df_overall = pd.concat(df_overall_frames)
             ###
+        if calcsessions == 1:
+            df_sessions = pd.DataFrame(list_sessions, columns=['subj_name', 'session', 'start_sec', 'duration_sec',
+                                                               'duration_min', 'active_sec', 'max_p', 'mean_p', 'sd_p'])
+            write_table(df_sessions, pathjoin(log_dir, outfilename_sessions), output_format)
         #df_overall.columns = ['subj_name', 'overall_mean_p', 'overall_sd_p']
         #df_overall.to_csv(pathjoin(log_dir, outfilename_pressure_bysubj))
         #df_full.columns =['subj_name', 'max_p', 'mean_p', 'median_p', 'skew_p', 'kurtosis_p', 'sd_p', 'IQR_p']
@@ -422,57 +541,63 @@ for folder in T_list:
                 full_name = subj_name_strip+'_'+day_name
                 list_subjday_tx.append(full_name)
                 day_name_str = str(day_name)
-                column_list = [0]
-                df = pd.read_csv(day, usecols=column_list)
-                df.columns = ["Pressure"] #read in .csv file, take only the first column, rename it to "Pressure"
-                df_boolean = df.Pressure.eq(df.Pressure.shift(-1)) #determine if consecutive pressure values match the previous value, label these as "True"
-                df['Boolean'] = df_boolean
-                boolean_list = df.Boolean.tolist()
-                counter=0
-                consec_list=[]
-                pos = -1
-                for idx, val in enumerate(boolean_list):
-                    if val==True and pos == -1:
-                        counter += 1
-                        pos = idx
-                    elif val == True:
-                        counter += 1
-                    elif pos != -1:
+                if splitlargedays == 1 and os.path.getsize(day) > largeday_mb*1e6: #runs are stitched across parallel chunks
+                    if day not in largeday_results:
+                        largeday_results[day] = chunked_day_stats(day, lower_cutoff, upper_cutoff, split_workers,
+                                                                  threshold=600)
+                    total_tx_rows = largeday_results[day]['rows']
+                    long_runs = largeday_results[day]['long_runs'] #[repeated value, number of repeats] for runs > 600
+                else:
+                    column_list = [0]
+                    df = pd.read_csv(day, usecols=column_list)
+                    df.columns = ["Pressure"] #read in .csv file, take only the first column, rename it to "Pressure"
+                    df["Pressure"] = pd.to_numeric(df.Pressure, errors='coerce') #non-numeric rows become NaN (never repeat)
+                    df_boolean = df.Pressure.eq(df.Pressure.shift(-1)) #determine if consecutive pressure values match the previous value, label these as "True"
+                    df['Boolean'] = df_boolean
+                    boolean_list = df.Boolean.tolist()
+                    counter=0
+                    consec_list=[]
+                    pos = -1
+                    for idx, val in enumerate(boolean_list):
+                        if val==True and pos == -1:
+                            counter += 1
+                            pos = idx
+                        elif val == True:
+                            counter += 1
+                        elif pos != -1:
+                            consec_list.append([pos,counter])
+                            pos = -1
+                            counter = 0
+                    if counter > 0:
                         consec_list.append([pos,counter])
-                        pos = -1
-                        counter = 0
-                if counter > 0:
-                    consec_list.append([pos,counter])
-                total_tx_rows = len(df.index)
-                for pair in consec_list: #iterate through each instance of repeats
-                    num_repeats = pair[1] #define number of consecutive repeats
-                    if num_repeats > 600: #if > 60 seconds of consecutive repeats
-                        row_num = pair[0] #define row number where this span of repeats began
-                        row_val = df.iloc[row_num, 0] #define pressure value being repeated
-                        row_val_str = str(row_val)
-                        logfile = open(pathjoin(log_dir,logfilename),'a')
-                        logfile.write('Case for '+subj_name+' '+day_name_str+':'+"\n"+"\n"
-                                      +'Series of Consecutive Values of '+row_val_str+' Exceeded 60 seconds.'
-                                      +"\n")
+                    total_tx_rows = len(df.index)
+                    long_runs = []
+                    for pair in consec_list: #iterate through each instance of repeats
+                        if pair[1] > 600: #if > 60 seconds of consecutive repeats
+                            long_runs.append([df.iloc[pair[0], 0], pair[1]]) #pressure value being repeated, number of repeats
+                for row_val, num_repeats in long_runs: #iterate through each instance of > 60 seconds of repeats
+                    row_val_str = str(row_val)
+                    logfile = open(pathjoin(log_dir,logfilename),'a')
+                    logfile.write('Case for '+subj_name+' '+day_name_str+':'+"\n"+"\n"
+                                  +'Series of Consecutive Values of '+row_val_str+' Exceeded 60 seconds.'
+                                  +"\n")
+                    logfile.close()
+                    if row_val == int(row_val): #if the repeated value is equal to a rounded version of itself (i.e. integar)
+                        row_val_dec = row_val  #define value
+                    else: #if the repeated value is not equal to the rounded version of itself (i.e. decimal)
+                        row_val_dec = Decimal(row_val) #define value
+                    if lower_range_fordel <= row_val_dec <= upper_range_fordel: #if this pressure value is in the range of +/- val of 0
+                        total_tx_rows = total_tx_rows - num_repeats #subtract consecutive 0 rows from total df length
+                        logfile = open(pathjoin(log_dir,logfilename),'a') #make note in log file about the break
+                        logfile.write('Values Within '+lower_range_fordel_str+'/+'+upper_range_fordel_str+' of 0; '
+                                      +'Time Removed from Total Tx Time.'+"\n"+"\n")
                         logfile.close()
-                        if row_val == int(row_val): #if the repeated value is equal to a rounded version of itself (i.e. integar)
-                            row_val_dec = row_val  #define value
-                        else: #if the repeated value is not equal to the rounded version of itself (i.e. decimal)
-                            row_val_dec = Decimal(row_val) #define value
-                        if lower_range_fordel <= row_val_dec <= upper_range_fordel: #if this pressure value is in the range of +/- val of 0
-                            total_tx_rows = total_tx_rows - num_repeats #subtract consecutive 0 rows from total df length
-                            logfile = open(pathjoin(log_dir,logfilename),'a') #make note in log file about the break
-                            logfile.write('Values Within '+lower_range_fordel_str+'/+'+upper_range_fordel_str+' of 0; '
-                                          +'Time Removed from Total Tx Time.'+"\n"+"\n")
-                            logfile.close()
-                        elif not lower_range_fordel <= row_val_dec <= upper_range_fordel: #if this pressure value is not 0
-                            logfile = open(pathjoin(log_dir,logfilename),'a') #make note in log file about the break
-                            logfile.write('Values Not Within '+lower_range_fordel_str+'/+'+upper_range_fordel_str+' of 0; '
-                                      +'Time Not Removed from Total Tx Time.'+"\n"+"\n")
-                            logfile.close()
-                            continue
-                    else: #if !> 60 seconds of consecutive repeats
-                         continue
+                    elif not lower_range_fordel <= row_val_dec <= upper_range_fordel: #if this pressure value is not 0
+                        logfile = open(pathjoin(log_dir,logfilename),'a') #make note in log file about the break
+                        logfile.write('Values Not Within '+lower_range_fordel_str+'/+'+upper_range_fordel_str+' of 0; '
+                                  +'Time Not Removed from Total Tx Time.'+"\n"+"\n")
+                        logfile.close()
+                        continue
                 net_tx_rows = total_tx_rows
                 total_tx_time_sec = net_tx_rows/10
                 total_tx_time_min = total_tx_time_sec/60
@@ -530,12 +655,22 @@ for folder in T_list:
         df_final_overall = pd.concat(df_final_overall_frame, axis=1)
         df_final_overall.columns = ['subj_name', 'overall_mean_p', 'overall_sd_p',
                                     'subj_name', 'mean_txtime_sec', 'mean_txtime_min', 'number_tx_days']
-        df_final_overall.to_csv(pathjoin(log_dir, outfilename_final_bysubj))
+        write_table(df_final_overall, pathjoin(log_dir, outfilename_final_bysubj), output_format)
         df_final_full_frame = [df_full, df_full_tx]
         df_final_full = pd.concat(df_final_full_frame, axis=1)
         df_final_full.columns = ['subj_name', 'max_p', 'mean_p', 'median_p', 'skew_p', 'kurtosis_p', 'sd_p', 'IQR_p',
                                     'subj_name', 'txtime_sec', 'txtime_min']
-        df_final_full.to_csv(pathjoin(log_dir, outfilename_final_bydate))
+        if output_format != 'csv': #other formats store the statistics as numbers: use the full-precision values
+            for k in range(6):
+                df_final_full.isetitem(k + 1, [day_stats[k] for day_stats in list_daystats])
+        if calcsessions == 1:
+            df_final_full['n_sessions'] = list_daysessions #number of treatment sessions per date
+        if filterartifacts == 1:
+            df_final_full['n_artifacts'] = list_daysartifacts #number of samples removed by the artifact filter per date
+        if calccounts == 1: #samples removed by each cutoff, NaN rows, and samples kept (before the artifact filter)
+            for k, column in enumerate(['n_below', 'n_above', 'n_nan', 'n_kept']):
+                df_final_full[column] = [day_counts[k] for day_counts in list_daycounts]
+        write_table(df_final_full, pathjoin(log_dir, outfilename_final_bydate), output_format)
         #df_overall_tx.columns = ['subj_name', 'mean_txtime_sec', 'mean_txtime_min']
         #df_overall_tx.to_csv(pathjoin(log_dir, outfilename_txtime_bysubj))
         #df_full_tx.columns =['subj_name', 'txtime_sec', 'txtime_min']
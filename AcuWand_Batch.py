@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Provides a batch runner that analyzes several studies with 'AcuWand Engine' on one persistent pool of worker processes.
+
+AcuWand Batch takes a list of job specs (study name, data root, subject-folder pattern, cutoffs, and output directory,
+plus any other AcuWand Engine setting), sorts them so that the jobs with the most input bytes start first, and runs them
+on a pool of worker processes that is kept for the whole batch, so interpreter start-up and imports are paid once per
+worker rather than once per study. A batch log .txt and summary .csv report the status, input size, and timing of
+every job; the run exits with status 1 when any job fails or finds no data.
+"""
+
+##### IMPORT BELOW #####
+import os
+from os.path import join as pathjoin
+from os.path import sep
+import sys
+import json
+import time
+import inspect
+import datetime
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from AcuWand_Engine import run_analysis
+from AcuWand_Tools import glob_folders, data_sources
+
+__author__ = "Noah C Waller"
+__copyright__ = "Copyright Pending"
+__credits__ = ["Noah C Waller"]
+__license__ = "PSF License Agreement"
+__version__ = "2.1"
+__year__ = "2023"
+__maintainer__ = "Noah C Waller"
+__email__ = "ncwaller@med.umich.edu"
+__status__ = "Production"
+
+##### INITIALIZE BELOW #####
+batch_jobs = [] #list of job specs, e.g. {'study_name': 'study_name', 'data_dir': '/data/study',
+                #'out_dir': '/results/study', 'subject_pattern': 'BPCR01*', 'lower_cutoff': -10, 'upper_cutoff': 10,
+                #'lower_range_fordel': -0.1, 'upper_range_fordel': 0.1}; any other run_analysis setting may be added
+batch_file = '' #optional .json file holding a list of job specs (added to batch_jobs)
+batch_workers = os.cpu_count() #number of worker processes kept for the whole batch
+dateandtime = str(datetime.datetime.now().strftime('%Y%m%d_%H%M%S')) #initializes date and time here
+
+##### DIRECTORIES BELOW #####
+batch_log_dir = pathjoin(sep) #define output directory for the batch log and summary
+
+
+##### JOBS BELOW #####
+required_keys = ['study_name', 'data_dir', 'out_dir']
+allowed_keys = list(inspect.signature(run_analysis).parameters) #job specs are passed to run_analysis as settings
+
+
+def load_jobs(jobs, path=''):
+    """Return the job specs of jobs plus those listed in the .json file at path (if given).
+
+    Raises ValueError when a job lacks a required key, has a key that is not a run_analysis setting, has a data_dir
+    that does not exist or holds no T# folders, or shares its study name and output directory with another job, so a
+    bad spec stops the batch before any job starts.
+    """
+    jobs = [dict(job) for job in jobs]
+    if path != '':
+        with open(path) as f:
+            jobs.extend(json.load(f))
+    outputs = {} #jobs with the same study name and output directory would write the same result and log files
+    for number, job in enumerate(jobs):
+        missing = [key for key in required_keys if key not in job]
+        if len(missing) != 0:
+            raise ValueError('Job '+str(number+1)+' is missing '+', '.join(missing))
+        unknown = [key for key in job if key not in allowed_keys]
+        if len(unknown) != 0:
+            raise ValueError('Job '+str(number+1)+' has unknown settings '+', '.join(unknown)
+                             +'... use the argument names of run_analysis in AcuWand Engine')
+        if not os.path.isdir(job['data_dir']):
+            raise ValueError('Job '+str(number+1)+' data_dir '+job['data_dir']+' does not exist')
+        if len(glob_folders(job['data_dir'], 'T*')) == 0:
+            raise ValueError('Job '+str(number+1)+' data_dir '+job['data_dir']+' has no T# folders')
+        output = (job['study_name'], os.path.normpath(os.path.abspath(job['out_dir'])))
+        if output in outputs:
+            raise ValueError('Jobs '+str(outputs[output]+1)+' and '+str(number+1)+' both write study '+job['study_name']
+                             +' to '+job['out_dir']+'... give each a different study_name or out_dir')
+        outputs[output] = number
+    return jobs
+
+
+def job_bytes(job):
+    """Return the total size in bytes of the data files of a job (its scheduling weight).
+
+    Compressed files and .zip archives count with their size on disk; an archive holding several subject folders (e.g.
+    a zipped T# folder) is counted once.
+    """
+    files = set()
+    for folder in glob_folders(job['data_dir'], 'T*'):
+        for subject_dir in glob_folders(folder, job.get('subject_pattern', 'BPCR01*')):
+            for path, source in data_sources(subject_dir).items():
+                if not path.endswith('_full.csv'):
+                    files.add(source if isinstance(source, str) else source[0])
+    return sum(os.path.getsize(path) for path in files)
+
+
+def _run_job(job, dateandtime):
+    """Run one job in a worker process and return (status, seconds, message).
+
+    The status is 'ok', 'failed' (run_analysis raised an error), or 'no_data' (no T# folder had a date with data).
+    """
+    start = time.perf_counter()
+    settings = {'dateandtime': dateandtime} #jobs share the batch date and time unless their spec sets one
+    settings.update(job)
+    try:
+        os.makedirs(job['out_dir'], exist_ok=True)
+        results = run_analysis(**settings)
+    except Exception:
+        return 'failed', time.perf_counter() - start, traceback.format_exc(limit=3).strip().splitlines()[-1]
+    if all(len(results[T_ID][0]) == 0 for T_ID in results if T_ID != 'log'):
+        return 'no_data', time.perf_counter() - start, 'no dates with data in '+job['data_dir']
+    return 'ok', time.perf_counter() - start, ''
+
+
+##### BATCH BELOW #####
+def run_batch(jobs, n_workers=None, log_dir=None, dateandtime=None):
+    """Run the jobs largest first on one persistent process pool and return the summary DataFrame.
+
+    Jobs are submitted in order of decreasing input bytes, so the pool starts the largest jobs first and small jobs
+    fill in the remaining workers at the end. Each job writes its results as run_analysis does; one failing job does
+    not stop the others. The batch log and summary are written to log_dir when it is given.
+    """
+    if dateandtime is None:
+        dateandtime = str(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    sizes = [job_bytes(job) for job in jobs]
+    order = sorted(range(len(jobs)), key=lambda number: sizes[number], reverse=True)
+    rows = {}
+    batch_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers) as pool: #workers are reused for every job
+        futures = {pool.submit(_run_job, jobs[number], dateandtime): number for number in order}
+        for future in as_completed(futures):
+            number = futures[future]
+            try:
+                status, seconds, message = future.result()
+            except Exception as error: #the worker process itself failed
+                status, seconds, message = 'failed', float('nan'), repr(error)
+            rows[number] = [jobs[number]['study_name'], jobs[number]['data_dir'], jobs[number]['out_dir'],
+                            round(sizes[number]/1e6, 3), order.index(number) + 1, status, round(seconds, 3),
+                            round(time.perf_counter() - batch_start, 3), message]
+            print(jobs[number]['study_name']+': '+status+' in '+str(round(seconds, 2))+' s'
+                  +('' if message == '' else ' ('+message+')'))
+    summary = pd.DataFrame([rows[number] for number in order],
+                           columns=['study_name', 'data_dir', 'out_dir', 'input_mb', 'submit_order', 'status',
+                                    'job_sec', 'finished_at_sec', 'message'])
+    if log_dir is not None:
+        logfile = open(pathjoin(log_dir, 'AcuWand_batch_log_'+dateandtime+'.txt'), 'x')
+        logfile.write('\n'+'\n'+'##############################'+"\n"+
+                      'AcuWand Batch Log Notes'+"\n"+
+                      'Batch Ran at '+dateandtime+"\n"+
+                      str(len(jobs))+' jobs on '+str(n_workers)+' workers in '
+                      +str(round(time.perf_counter() - batch_start, 2))+' s'+"\n"+
+                      '##############################'+'\n'+'\n')
+        for row in summary.itertuples():
+            logfile.write('Job '+str(row.submit_order)+': '+row.study_name+' ('+row.data_dir+', '+str(row.input_mb)+' MB) '
+                          +row.status+' in '+str(row.job_sec)+' s'
+                          +('' if row.message == '' else '... '+row.message)+"\n"+"\n")
+        logfile.close()
+        summary.to_csv(pathjoin(log_dir, 'AcuWand_batch_summary_'+dateandtime+'.csv'), index=False)
+    return summary
+
+
+if __name__ == '__main__':
+    summary = run_batch(load_jobs(batch_jobs, batch_file), batch_workers, batch_log_dir, dateandtime)
+    sys.exit(0 if (summary.status == 'ok').all() else 1)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Provides a function-based, vectorized engine that reproduces the results of 'AcuWand Analysis.'
+
+AcuWand Engine follows the same file discovery, date grouping, merging, cleaning, and statistics rules as the analysis
+script, but merges each date in memory instead of writing and re-reading _full.csv files, and finds repeated values with
+NumPy instead of a per-row Python loop. Results are written with the same names and layout as the analysis script so the
+two can be compared directly (see 'AcuWand Harness').
+"""
+
+##### IMPORT BELOW #####
+from os.path import join as pathjoin
+import datetime
+import statistics
+import math
+import pandas as pd
+import numpy as np
+from AcuWand_Tools import (find_duplicate_parts, boundary_overlap, write_table, segment_pressure_stats, long_repeat_runs,
+                           treatment_sessions, glob_data, open_data, hampel_outliers, cutoff_mask, format_fallback,
+                           glob_folders, not_folders)
+
+__author__ = "Noah C Waller"
+__copyright__ = "Copyright Pending"
+__credits__ = ["Noah C Waller"]
+__license__ = "PSF License Agreement"
+__version__ = "2.1"
+__year__ = "2023"
+__maintainer__ = "Noah C Waller"
+__email__ = "ncwaller@med.umich.edu"
+__status__ = "Production"
+
+
+##### FILE DISCOVERY BELOW #####
+def subject_day_list(subject_dir, T_ID):
+    """Return (format_style, day_list) for a subject, with day_list ordered by date as in the analysis script.
+
+    format_style is 0 when the subject has no readable data. Merged _full.csv files are never included.
+    """
+    day_list_format1 = glob_data(subject_dir, '*'+'_'+'*'+'_'+'*'+'-'+'*'+'-'+'*'+'_'+'*'+'_'+'*.csv') #Format 1
+    day_list_format2 = glob_data(subject_dir, '*'+'_'+'*'+'___'+'*'+'-'+'*'+'-'+'*'+'___'+'*'+'___'+'*'+'_'+'*.csv') #Format 2
+    day_list_format3 = glob_data(subject_dir, '*'+T_ID+'_'+'*'+'-'+'*'+'-'+'*.csv') #Format 3
+    day_list_format1 = [x for x in day_list_format1 if not x.endswith('_full.csv')]
+    day_list_format2 = [x for x in day_list_format2 if not x.endswith('_full.csv')]
+    day_list_format3 = [x for x in day_list_format3 if not x.endswith('_full.csv')]
+    if len(day_list_format3) != 0: #Format 3 is the most stringent, start here
+        day_list = day_list_format3
+        day_list.sort()
+        return 3, day_list
+    elif len(day_list_format2) != 0:
+        format_style, day_list_original = 2, day_list_format2
+    elif len(day_list_format1) != 0:
+        format_style, day_list_original = 1, day_list_format1
+    else:
+        return 0, []
+    day_list_noinstance = [] #sort by date: drop the wand and instance labels (first 10 characters) before sorting
+    for day in day_list_original:
+        day_name = day.split('/')[-1].replace(".csv","")
+        day_list_noinstance.append(day.replace("{}".format(day_name[0:10]),""))
+    day_list_noinstance.sort()
+    day_list = []
+    for revised_day in day_list_noinstance:
+        day_name = revised_day.split('/')[-1]
+        for original_day in day_list_original:
+            if original_day.endswith(day_name) == True:
+                day_list.append(original_day)
+    return format_style, day_list
+
+
+def day_date(day, format_style):
+    """Return the date part of a day file name for the given naming format."""
+    day_name = day.split('/')[-1].replace(".csv","")
+    if format_style == 2:
+        return day_name.split('_')[4]
+    return day_name.split('_')[2] #Format 1 and Format 3
+
+
+def group_by_date(day_list, format_style):
+    """Group consecutive files of day_list that share a date into lists of parts."""
+    list_oflists = []
+    for day in day_list:
+        if len(list_oflists) != 0 and day_date(list_oflists[-1][0], format_style) == day_date(day, format_style):
+            list_oflists[-1].append(day)
+        else:
+            list_oflists.append([day])
+    return list_oflists
+
+
+def merged_day_name(list_v):
+    """Return the merged (_full.csv) name of a date from its first part, without the part suffix."""
+    merge_day_name = list_v[0].split('/')[-1].replace(".csv","")
+    if merge_day_name.endswith("_part1"):
+        merge_day_name = merge_day_name.replace("_part1","")
+    if merge_day_name.endswith("_part 1"):
+        merge_day_name = merge_day_name.replace("_part 1","")
+    if merge_day_name.endswith("_part1_graph"):
+        merge_day_name = merge_day_name.replace("_part1_graph","")
+    if merge_day_name.endswith("_Part1"):
+        merge_day_name = merge_day_name.replace("_Part1","")
+    return merge_day_name
+
+
+def read_merged_day(list_v, with_part_starts=False):
+    """Return the pressure values of a date as the analysis script reads them back from its _full.csv file.
+
+    Each part's first row is its header and only the first column is used; parts are aligned on their header, so a
+    part whose header differs from the first part's contributes empty (NaN) rows, exactly as in the script. With
+    with_part_starts, (values, part_starts) is returned, where part_starts lists the rows where each later part begins.
+    """
+    merge_df = pd.DataFrame()
+    part_rows = []
+    for f in list_v:
+        with open_data(f) as handle: #streams compressed and archived parts straight into the parser
+            df = pd.read_csv(handle)
+        part_rows.append(len(df))
+        merge_df = pd.concat([merge_df, df[df.columns[0]]])
+    if merge_df.shape[1] == 0:
+        values = np.zeros(0, dtype='float64')
+    else:
+        values = pd.to_numeric(merge_df.iloc[:, 0], errors='coerce').to_numpy(dtype='float64') #non-numeric rows: NaN
+    if with_part_starts:
+        return values, np.cumsum(part_rows)[:-1]
+    return values
+
+
+##### TREATMENT TIME BELOW #####
+def treatment_rows(values, lower_range_fordel, upper_range_fordel, threshold=600):
+    """Return (net treatment rows, long_runs) where long_runs lists [value, repeats, removed] for runs over threshold."""
+    total_tx_rows = len(values)
+    long_runs = []
+    for row_val, num_repeats in long_repeat_runs(values, threshold):
+        removed = lower_range_fordel <= row_val <= upper_range_fordel #repeated value within the range around 0
+        if removed:
+            total_tx_rows = total_tx_rows - num_repeats
+        long_runs.append([row_val, num_repeats, removed])
+    return total_tx_rows, long_runs
+
+
+##### ANALYSIS BELOW #####
+def run_analysis(data_dir, out_dir, study_name='study_name', subject_pattern='BPCR01*', lower_cutoff=-10,
+                 upper_cutoff=10, lower_range_fordel=-0.1, upper_range_fordel=0.1, remove_duplicates=True,
+                 output_format='csv', dateandtime=None, calc_sessions=False, session_gap_sec=30, session_min_sec=10,
+                 filter_artifacts=False, hampel_window=21, hampel_threshold=3, hampel_min_dev=0.5, calc_counts=True):
+    """Analyze every T# folder of data_dir and write the log and result files to out_dir.
+
+    Settings match the INITIALIZE section of the analysis script (calc_sessions for calcsessions = 1, filter_artifacts
+    for filterartifacts = 1, calc_counts for calccounts = 1). Returns a dict mapping each T# folder to its (resultsbydate, resultsbysubj) DataFrames;
+    the log file path is stored under 'log'.
+    """
+    if dateandtime is None:
+        dateandtime = str(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+    lower_range_fordel_str = str(lower_range_fordel)
+    upper_range_fordel_str = str(upper_range_fordel)
+    logfilename = pathjoin(out_dir, study_name+'_analysis_log_'+dateandtime+'.txt')
+    log = ['\n'+'\n'+'##############################'+"\n"+
+           study_name+' Data Log Notes'+"\n"+
+           'Script Ran at '+dateandtime+"\n"+
+           'Please Contact Noah Waller at ncwaller@umich.edu for Errors/Issues'+'\n'+
+           '##############################'+'\n'+'\n']
+    output_note = format_fallback(output_format)[1]
+    if output_note != '':
+        log.append('Output Format Note: '+output_note+'\n'+'\n')
+    results = {'log': logfilename}
+    T_list = glob_folders(data_dir, 'T*') #zipped T# and subject folders are listed as folders
+    for path in not_folders(data_dir, 'T*'):
+        log.append('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+    for folder in T_list:
+        T_ID = folder.split('/')[-1]
+        subjects_list = glob_folders(folder, subject_pattern)
+        for path in not_folders(folder, subject_pattern):
+            log.append('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+        log.append('\n'+'Subjects Included in AcuWand '+T_ID+' Analysis: '+'\n'+
+                   str([subj.split('/')[-1] for subj in subjects_list])+'\n'+
+                   'Lower Cutoff for Pressure Values: '+str(lower_cutoff)+'\n'+
+                   'Upper Cutoff for Pressure Values: '+str(upper_cutoff)+'\n'+
+                   'Range for Consecutive Pressure Value Removal Around Zero: '+lower_range_fordel_str+
+                   '/+'+upper_range_fordel_str+'\n'+'\n')
+        log.append('\n'+'File Preparation Unique Cases (Merge & Clean):'+'\n'+'\n')
+        log_tx = ['\n'+'Notes About Excessive Repeated Values in Total Treatment Time Calculations:'+'\n'+'\n']
+        rows_bydate = []
+        index_bydate = []
+        rows_bysubj = []
+        rows_sessions = []
+        for subject_dir in subjects_list:
+            subj_name_strip = subject_dir.split('/')[-1]
+            subj_name = 'subject: '+subj_name_strip
+            format_style, day_list = subject_day_list(subject_dir, T_ID)
+            if format_style == 0:
+                log.append('No Readable Data for '+subj_name+'... skipping subject for .csv preparation.'+"\n"+"\n")
+                continue
+            log.append(subj_name+' data is in Format Style: '+str(format_style)+"\n"+"\n")
+            list_oflists = group_by_date(day_list, format_style)
+            if len(list_oflists) < len(day_list):
+                log.append('Multiple parts for at least 1 date for '+subj_name+'... check participant log to ensure '
+                           +'files are not multiple hours apart.'+"\n"+"\n")
+            day_results = {} #merged day name -> (treatment rows, long runs, sessions, artifacts, cutoff counts); a later date with the same name replaces it
+            day_kept = {} #merged day name -> cutoff-filtered values, reduced for all days of the subject at once
+            for list_v in list_oflists:
+                merge_day_name = merged_day_name(list_v)
+                if remove_duplicates:
+                    list_v, duplicate_pairs = find_duplicate_parts(list_v)
+                    for pair in duplicate_pairs:
+                        log.append('Duplicate File for '+subj_name+': '+pair[0].split('/')[-1]+' is identical to '
+                                   +pair[1].split('/')[-1]+'... excluded from merge.'+"\n"+"\n")
+                    for prev_part, next_part in zip(list_v[:-1], list_v[1:]):
+                        overlap_rows = boundary_overlap(prev_part, next_part)
+                        if overlap_rows > 0:
+                            log.append('Partial Overlap for '+subj_name+': last '+str(overlap_rows)+' rows of '
+                                       +prev_part.split('/')[-1]+' repeat at start of '+next_part.split('/')[-1]
+                                       +'... check participant log, rows were not removed.'+"\n"+"\n")
+                values, part_starts = read_merged_day(list_v, True) #one date in memory at a time (plus the kept values)
+                keep, cutoff_counts = cutoff_mask(values, lower_cutoff, upper_cutoff)
+                kept = values[keep]
+                n_artifacts = None
+                if filter_artifacts:
+                    artifacts = hampel_outliers(kept, hampel_window, hampel_threshold, hampel_min_dev)
+                    kept = kept[~artifacts]
+                    n_artifacts = int(artifacts.sum())
+                day_kept[merge_day_name] = kept
+                day_results[merge_day_name] = (*treatment_rows(values, lower_range_fordel, upper_range_fordel),
+                                               treatment_sessions(values, lower_cutoff, upper_cutoff, lower_range_fordel,
+                                                                  upper_range_fordel, session_gap_sec, session_min_sec,
+                                                                  part_starts)
+                                               if calc_sessions else None, n_artifacts, cutoff_counts)
+            if len(list_oflists) != 0:
+                del values, keep #the last date is not needed while the subject's statistics are computed
+            list_m_mean = []
+            list_m_sd = []
+            list_tx_sec = []
+            list_tx_min = []
+            day_names = sorted(day_results, key=lambda name: name+'_full.csv') #_full.csv order
+            day_counts = [day_kept[day_name].size for day_name in day_names]
+            subject_kept = np.empty(sum(day_counts)) #filled day by day so that each day's copy is freed as it is added
+            for day_name, end in zip(day_names, np.cumsum(day_counts)):
+                kept = day_kept.pop(day_name)
+                subject_kept[end - kept.size:end] = kept
+            del kept
+            subject_stats = segment_pressure_stats(subject_kept, day_counts, overwrite=True) #all days at once
+            del subject_kept
+            for i, day_name in enumerate(day_names):
+                total_tx_rows, long_runs, day_sessions, n_artifacts, cutoff_counts = day_results[day_name]
+                day = {key: subject_stats[key][i] for key in subject_stats}
+                if math.isnan(day['mean']) == False:
+                    list_m_mean.append(day['mean'])
+                if math.isnan(day['sd']) == False:
+                    list_m_sd.append(day['sd'])
+                for row_val, num_repeats, removed in long_runs:
+                    log_tx.append('Case for '+subj_name+' '+day_name+':'+"\n"+"\n"
+                                  +'Series of Consecutive Values of '+str(row_val)+' Exceeded 60 seconds.'+"\n")
+                    if removed:
+                        log_tx.append('Values Within '+lower_range_fordel_str+'/+'+upper_range_fordel_str+' of 0; '
+                                      +'Time Removed from Total Tx Time.'+"\n"+"\n")
+                    else:
+                        log_tx.append('Values Not Within '+lower_range_fordel_str+'/+'+upper_range_fordel_str+' of 0; '
+                                      +'Time Not Removed from Total Tx Time.'+"\n"+"\n")
+                total_tx_time_sec = total_tx_rows/10
+                total_tx_time_min = total_tx_time_sec/60
+                list_tx_sec.append(total_tx_time_sec)
+                list_tx_min.append(total_tx_time_min)
+                full_name = subj_name_strip+'_'+day_name
+                rows_bydate.append([full_name, day['max'], day['mean'], day['median'], day['skew'],
+                                    day['kurtosis'] - 3, day['sd'], 'NaN' if day['count'] == 0 else day['Q3'] - day['Q1'],
+                                    full_name, total_tx_time_sec, total_tx_time_min])
+                if calc_sessions:
+                    for k in range(len(day_sessions['start_sec'])):
+                        rows_sessions.append([full_name, k+1, day_sessions['start_sec'][k], day_sessions['duration_sec'][k],
+                                              day_sessions['duration_sec'][k]/60, day_sessions['active_sec'][k],
+                                              day_sessions['max'][k], day_sessions['mean'][k], day_sessions['sd'][k]])
+                    rows_bydate[-1].append(len(day_sessions['start_sec']))
+                if filter_artifacts:
+                    rows_bydate[-1].append(n_artifacts)
+                if calc_counts:
+                    rows_bydate[-1].extend([cutoff_counts['below'], cutoff_counts['above'], cutoff_counts['nan'],
+                                            cutoff_counts['kept']])
+                index_bydate.append(i)
+            if len(day_results) == 0:
+                continue
+            rows_bysubj.append([subj_name_strip,
+                                statistics.fmean(list_m_mean) if len(list_m_mean) != 0 else 'NaN',
+                                statistics.fmean(list_m_sd) if len(list_m_sd) != 0 else 'NaN',
+                                subj_name_strip,
+                                statistics.mean(list_tx_sec) if len(list_tx_sec) > 1 else list_tx_sec[-1],
+                                statistics.mean(list_tx_min) if len(list_tx_min) > 1 else list_tx_min[-1],
+                                len(day_results)])
+        df_final_full = pd.DataFrame(rows_bydate, index=index_bydate,
+                                     columns=['subj_name', 'max_p', 'mean_p', 'median_p', 'skew_p', 'kurtosis_p', 'sd_p',
+                                              'IQR_p', 'subj_name', 'txtime_sec', 'txtime_min']
+                                             + (['n_sessions'] if calc_sessions else [])
+                                             + (['n_artifacts'] if filter_artifacts else [])
+                                             + (['n_below', 'n_above', 'n_nan', 'n_kept'] if calc_counts else []))
+        df_final_overall = pd.DataFrame(rows_bysubj, index=[0]*len(rows_bysubj),
+                                        columns=['subj_name', 'overall_mean_p', 'overall_sd_p', 'subj_name',
+                                                 'mean_txtime_sec', 'mean_txtime_min', 'number_tx_days'])
+        write_table(df_final_overall, pathjoin(out_dir, study_name+'_'+T_ID+'_resultsbysubj_'+dateandtime+'.csv'),
+                    output_format)
+        write_table(df_final_full, pathjoin(out_dir, study_name+'_'+T_ID+'_resultsbydate_'+dateandtime+'.csv'),
+                    output_format)
+        if calc_sessions:
+            df_sessions = pd.DataFrame(rows_sessions, columns=['subj_name', 'session', 'start_sec', 'duration_sec',
+                                                               'duration_min', 'active_sec', 'max_p', 'mean_p', 'sd_p'])
+            write_table(df_sessions, pathjoin(out_dir, study_name+'_'+T_ID+'_sessions_'+dateandtime+'.csv'),
+                        output_format)
+        results[T_ID] = (df_final_full, df_final_overall)
+        log.extend(log_tx)
+    log.append('\n'+'##############################'+"\n"+
+               'END LOG'+'\n'
+               '##############################'+'\n')
+    logfile = open(logfilename,'x')
+    logfile.write(''.join(log))
+    logfile.close()
+    return results
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Provides golden-output equivalence and performance regression checks of 'AcuWand Engine' against 'AcuWand Analysis.'
+
+AcuWand Harness runs the analysis script (the legacy code path) and the engine on the same fixture trees, compares the
+_resultsbydate_ and _resultsbysubj_ .csv files of every T# folder within a numeric tolerance, and records the speedup
+and memory ratio of the engine. Each fixture is also run once (untimed) under every entry of parity_settings, so code
+paths that are off by default are compared as well. Synthetic fixture trees covering the known edge cases (empty
+filtered days, single-day subjects, subjects without readable data, multi-part and duplicate days, and Format 1/2/3
+mixes) are built when no fixture directory is given, and both sides are then also compared with the golden result files
+committed in harness_golden, so a change that alters the analysis script and the engine alike is caught as well.
+AcuWand Preview is run on each fixture with several seeds to record how often its confidence intervals contain the exact
+engine results (the coverage the preview log reports). The run fails (exit status 1) when any result differs,
+performance falls below the limits, or the preview coverage falls below min_preview_coverage.
+"""
+
+##### IMPORT BELOW #####
+import os
+from os.path import join as pathjoin
+from glob import glob
+import sys
+import re
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+import warnings
+import datetime
+import pandas as pd
+import numpy as np
+from AcuWand_Engine import run_analysis
+from AcuWand_Preview import run_preview, preview_confidence
+
+__author__ = "Noah C Waller"
+__copyright__ = "Copyright Pending"
+__credits__ = ["Noah C Waller"]
+__license__ = "PSF License Agreement"
+__version__ = "2.1"
+__year__ = "2023"
+__maintainer__ = "Noah C Waller"
+__email__ = "ncwaller@med.umich.edu"
+__status__ = "Production"
+
+##### INITIALIZE BELOW #####
+fixture_dirs = [] #list of fixture data directories (each holding T# folders); leave empty to build synthetic fixtures
+fixture_rows = 20000 #rows per synthetic day file (10 rows per second)
+timing_repeats = 3 #each side is timed this many times and the fastest run is kept
+rtol = 1e-6 #relative tolerance for numeric result comparison
+atol = 1e-6 #absolute tolerance (the analysis script prints pressure statistics to 6 decimals)
+min_speedup = 1.0 #fail if the engine is not at least this many times faster than the analysis script
+min_memory_ratio = 1.0 #fail if the engine peak memory is not at least this many times lower than the analysis script
+regression_margin = 0.8 #fail if speedup or memory ratio drop below this fraction of the best recorded run
+parity_settings = [{'splitlargedays': 1, 'largeday_mb': 0, 'split_workers': 2}, #analysis script setting overrides run
+                   {'calcsessions': 1}, #once per fixture (untimed); the script and engine results are compared for
+                   {'filterartifacts': 1}, #each (largeday_mb = 0 forces every day through the parallel chunked path,
+                   {'calcsessions': 1, 'filterartifacts': 1, #which the engine does not use)
+                    'splitlargedays': 1, 'largeday_mb': 0, 'split_workers': 2}]
+golden_settings = {'default': {}, #golden file sets: harness_golden/<name> holds the analysis script results of the
+                   'sessions_artifacts': {'calcsessions': 1, 'filterartifacts': 1}} #synthetic fixtures (fixture_rows =
+                   #20000) under these setting overrides
+update_golden = 0 #use 1 to rewrite the golden files from this run's analysis script results (only for intended changes)
+preview_seeds = 10 #AcuWand Preview is run this many times (seeds 0, 1, ...) per fixture to measure how often its
+                   #confidence intervals contain the exact engine results; the preview log reports the last coverage
+min_preview_coverage = 0.75 #fail if preview intervals contain fewer than this fraction of the date or subject results
+keep_runs = 0 #use 1 to keep the fixtures and outputs of passing runs (those of failing runs are always kept)
+dateandtime = str(datetime.datetime.now().strftime('%Y%m%d_%H%M%S')) #initializes date and time here
+
+##### DIRECTORIES BELOW #####
+script_dir = os.path.dirname(os.path.abspath(__file__)) #folder holding AcuWand_Analysis.py
+harness_dir = pathjoin(tempfile.gettempdir(), 'acuwand_harness') #define output directory for harness runs
+golden_dir = pathjoin(script_dir, 'harness_golden') #golden results of the synthetic fixtures (kept under version control)
+record_file = pathjoin(script_dir, 'harness_record.jsonl') #one line per harness run, used for regression limits
+
+
+##### FIXTURES BELOW #####
+def write_part(path, values, header='Pressure'):
+    """Write one AcuWand .csv part with a header row; NaN values are written as blank rows."""
+    with open(path, 'w') as f:
+        f.write(header+'\n')
+        f.write('\n'.join('' if np.isnan(v) else repr(float(v)) for v in values)+'\n')
+
+
+def wand_signal(rng, n_rows):
+    """Return a synthetic pressure signal with sessions, idle 0 spans over 60 seconds, and out-of-range spikes."""
+    values = np.round(rng.normal(2.5, 1.5, n_rows), 2)
+    values[rng.random(n_rows) < 0.005] = 15.0 #above the upper cutoff
+    for start in rng.integers(0, max(n_rows - 1000, 1), 3):
+        values[start:start + int(rng.integers(400, 1000))] = 0.0 #idle wand
+    return values
+
+
+def build_fixtures(root, n_rows=fixture_rows):
+    """Build a synthetic two-T# fixture tree under root covering the analysis edge cases."""
+    rng = np.random.default_rng(2023)
+    t1 = pathjoin(root, 'T1')
+    subj = pathjoin(t1, 'BPCR01-0001-001') #Format 3, multi-part date
+    os.makedirs(subj)
+    write_part(pathjoin(subj, 'BPCR01-0001-001_T1_1-18-79_part1.csv'), wand_signal(rng, n_rows))
+    write_part(pathjoin(subj, 'BPCR01-0001-001_T1_1-18-79_part2.csv'), wand_signal(rng, n_rows//2))
+    write_part(pathjoin(subj, 'BPCR01-0001-001_T1_1-19-79.csv'), wand_signal(rng, n_rows))
+    write_part(pathjoin(subj, 'BPCR01-0001-001_T1_1-20-79.csv'), wand_signal(rng, n_rows))
+    subj = pathjoin(t1, 'BPCR01-0001-002') #Format 1, second date entirely above the upper cutoff (day_IQR = 'NaN')
+    os.makedirs(subj)
+    write_part(pathjoin(subj, '00001_0005_18-01-2079_01-22-33_03679.csv'), wand_signal(rng, n_rows))
+    write_part(pathjoin(subj, '00001_0006_19-01-2079_01-22-33_03000.csv'), np.full(n_rows//4, 50.0))
+    subj = pathjoin(t1, 'BPCR01-0001-003') #Format 2, single-day subject
+    os.makedirs(subj)
+    write_part(pathjoin(subj, '00001_0005___01-18-79___01-22___7.0_mins.csv'), wand_signal(rng, n_rows))
+    subj = pathjoin(t1, 'BPCR01-0001-004') #no readable data
+    os.makedirs(subj)
+    write_part(pathjoin(subj, 'BPCR01-0001-004_DataSheet.csv'), np.zeros(10))
+    t2 = pathjoin(root, 'T2')
+    subj = pathjoin(t2, 'BPCR01-0002-001') #Format 3 with a duplicate upload of the same part
+    os.makedirs(subj)
+    write_part(pathjoin(subj, 'BPCR01-0002-001_T2_2-01-79.csv'), wand_signal(rng, n_rows))
+    shutil.copy(pathjoin(subj, 'BPCR01-0002-001_T2_2-01-79.csv'), pathjoin(subj, 'BPCR01-0002-001_T2_2-01-79_part 1.csv'))
+    write_part(pathjoin(subj, 'BPCR01-0002-001_T2_2-02-79.csv'), wand_signal(rng, n_rows))
+    subj = pathjoin(t2, 'BPCR01-0002-002') #Format 1 with blank rows and very short days
+    os.makedirs(subj)
+    values = wand_signal(rng, n_rows)
+    values[rng.random(n_rows) < 0.01] = np.nan
+    write_part(pathjoin(subj, '00002_0001_01-02-2079_09-00-00_20000.csv'), values)
+    write_part(pathjoin(subj, '00002_0002_02-02-2079_09-00-00_00003.csv'), np.array([1.0, 2.0, 3.0]))
+    write_part(pathjoin(subj, '00002_0003_03-02-2079_09-00-00_00001.csv'), np.array([4.0]))
+    subj = pathjoin(t2, 'BPCR01-0002-003') #Format 2, two dates
+    os.makedirs(subj)
+    write_part(pathjoin(subj, '00002_0004___02-01-79___10-00___33.3_mins.csv'), wand_signal(rng, n_rows))
+    write_part(pathjoin(subj, '00002_0005___02-02-79___10-00___33.3_mins.csv'), wand_signal(rng, n_rows))
+
+
+##### RUNNERS BELOW #####
+def run_legacy(data_dir, out_dir, overrides=None):
+    """Run AcuWand_Analysis.py on data_dir with its output in out_dir and return its settings namespace.
+
+    overrides maps INITIALIZE setting names of the script to the values used instead of the script defaults.
+    """
+    script = pathjoin(script_dir, 'AcuWand_Analysis.py')
+    source = open(script).read()
+    source = re.sub(r'^data_dir = .*$', 'data_dir = '+repr(data_dir), source, count=1, flags=re.M)
+    source = re.sub(r'^log_dir = .*$', 'log_dir = '+repr(out_dir), source, count=1, flags=re.M)
+    for name, value in (overrides or {}).items():
+        source, found = re.subn(r'^'+name+r' ?=.*$', name+' = '+repr(value), source, count=1, flags=re.M)
+        if found == 0:
+            raise KeyError('AcuWand_Analysis.py has no setting '+name)
+    namespace = {'__name__': '__acuwand_legacy__', '__file__': script}
+    cwd = os.getcwd()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning) #newer pandas warns about float() of 1-element Series
+            exec(compile(source, script, 'exec'), namespace) #the script changes into subject folders while merging
+    finally:
+        os.chdir(cwd)
+    return namespace
+
+
+def run_engine(data_dir, out_dir, settings):
+    """Run the engine on data_dir with the legacy settings and its output in out_dir."""
+    run_analysis(data_dir, out_dir, study_name=settings['study_name'], lower_cutoff=settings['lower_cutoff'],
+                 upper_cutoff=settings['upper_cutoff'], lower_range_fordel=settings['lower_range_fordel'],
+                 upper_range_fordel=settings['upper_range_fordel'],
+                 remove_duplicates=settings.get('removeduplicates', 0) == 1, output_format='csv',
+                 dateandtime=settings['dateandtime'], calc_sessions=settings.get('calcsessions', 0) == 1,
+                 session_gap_sec=settings.get('session_gap_sec', 30), session_min_sec=settings.get('session_min_sec', 10),
+                 filter_artifacts=settings.get('filterartifacts', 0) == 1, hampel_window=settings.get('hampel_window', 21),
+                 hampel_threshold=settings.get('hampel_threshold', 3), hampel_min_dev=settings.get('hampel_min_dev', 0.5),
+                 calc_counts=settings.get('calccounts', 0) == 1)
+
+
+def timed(function, *args):
+    """Return (result, seconds) of function(*args)."""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def peak_memory(function, *args):
+    """Return the peak traced memory in bytes of function(*args) (run separately from timing)."""
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+##### COMPARISON BELOW #####
+def compare_results(legacy_file, engine_file):
+    """Return a list of mismatch descriptions between a legacy and an engine result .csv file."""
+    legacy = pd.read_csv(legacy_file, index_col=0, dtype=str, keep_default_na=False)
+    engine = pd.read_csv(engine_file, index_col=0, dtype=str, keep_default_na=False)
+    name = legacy_file.split('/')[-1]
+    if list(legacy.columns) != list(engine.columns):
+        return [name+': columns differ '+str(list(legacy.columns))+' / '+str(list(engine.columns))]
+    if len(legacy) != len(engine):
+        return [name+': '+str(len(legacy))+' rows (legacy) / '+str(len(engine))+' rows (engine)']
+    mismatches = []
+    for column in legacy.columns:
+        legacy_col = legacy[column].str.strip()
+        engine_col = engine[column].str.strip()
+        if column.startswith('subj_name'):
+            for row in np.flatnonzero((legacy_col != engine_col).to_numpy()):
+                mismatches.append(name+' row '+str(row)+' '+column+': '+legacy_col.iloc[row]+' / '+engine_col.iloc[row])
+            continue
+        legacy_num = legacy_col.replace('', 'nan').astype('float64').to_numpy() #blank and 'NaN' both read as NaN
+        engine_num = engine_col.replace('', 'nan').astype('float64').to_numpy()
+        close = np.isclose(legacy_num, engine_num, rtol=rtol, atol=atol, equal_nan=True)
+        for row in np.flatnonzero(~close):
+            mismatches.append(name+' row '+str(row)+' '+column+': '+str(legacy_num[row])+' / '+str(engine_num[row]))
+    return mismatches
+
+
+def compare_dirs(legacy_dir, engine_dir, label=''):
+    """Return a list of mismatch descriptions between the result (and session) files of a legacy and an engine run."""
+    legacy_files = sorted(glob(pathjoin(legacy_dir, '*_results*.csv')) + glob(pathjoin(legacy_dir, '*_sessions_*.csv')))
+    if len(legacy_files) == 0:
+        return [label+legacy_dir+': analysis script wrote no result files']
+    mismatches = []
+    for legacy_file in legacy_files:
+        engine_file = pathjoin(engine_dir, legacy_file.split('/')[-1])
+        if not os.path.exists(engine_file):
+            mismatches.append(label+legacy_file.split('/')[-1]+': not written by the engine')
+            continue
+        mismatches.extend(label+mismatch for mismatch in compare_results(legacy_file, engine_file))
+    return mismatches
+
+
+def golden_name(result_file, study_name):
+    """Return the golden file name of a result file: its name without the study name and the date and time of the run."""
+    return re.sub(r'_\d{8}_\d{6}\.csv$', '.csv', result_file.split('/')[-1])[len(study_name)+1:]
+
+
+def compare_golden(golden_set, result_dir, study_name, label=''):
+    """Return a list of mismatch descriptions between the golden files of golden_set and the result files of a run."""
+    golden_files = sorted(glob(pathjoin(golden_dir, golden_set, '*.csv')))
+    if len(golden_files) == 0:
+        return [label+'no golden files in '+pathjoin(golden_dir, golden_set)+' (run once with update_golden = 1)']
+    result_files = {golden_name(path, study_name): path for path in
+                    glob(pathjoin(result_dir, '*_results*.csv')) + glob(pathjoin(result_dir, '*_sessions_*.csv'))}
+    mismatches = [label+name+': no golden file' for name in sorted(set(result_files) - set(
+                  path.split('/')[-1] for path in golden_files))]
+    for golden_file in golden_files:
+        name = golden_file.split('/')[-1]
+        if name not in result_files:
+            mismatches.append(label+name+': not written')
+            continue
+        mismatches.extend(label+mismatch for mismatch in compare_results(golden_file, result_files[name]))
+    return mismatches
+
+
+def write_golden(golden_set, result_dir, study_name):
+    """Replace the golden files of golden_set with the result files of an analysis script run."""
+    shutil.rmtree(pathjoin(golden_dir, golden_set), ignore_errors=True)
+    os.makedirs(pathjoin(golden_dir, golden_set))
+    for path in glob(pathjoin(result_dir, '*_results*.csv')) + glob(pathjoin(result_dir, '*_sessions_*.csv')):
+        shutil.copy(path, pathjoin(golden_dir, golden_set, golden_name(path, study_name)))
+
+
+##### PREVIEW COVERAGE BELOW #####
+def preview_coverage(data_dir, engine_dir, out_dir, settings):
+    """Return {'date': (contained, checked), 'subject': (contained, checked)} over preview_seeds runs of AcuWand Preview
+    on data_dir: how many of its confidence intervals contain the exact result in the engine result files of engine_dir.
+
+    Dates read in full (their intervals are the exact result) and values without an interval or exact result are not
+    checked.
+    """
+    counts = {'date': [0, 0], 'subject': [0, 0]}
+    for seed in range(preview_seeds):
+        results = run_preview(data_dir, out_dir, study_name=settings['study_name'],
+                              lower_cutoff=settings['lower_cutoff'], upper_cutoff=settings['upper_cutoff'],
+                              lower_range_fordel=settings['lower_range_fordel'],
+                              upper_range_fordel=settings['upper_range_fordel'],
+                              remove_duplicates=settings.get('removeduplicates', 0) == 1, output_format='csv',
+                              dateandtime=settings['dateandtime']+'_'+str(seed), seed=seed)
+        for T_ID in [key for key in results if key != 'log']:
+            for level, preview, kind in (('date', results[T_ID][0], 'bydate'), ('subject', results[T_ID][1], 'bysubj')):
+                exact_file = glob(pathjoin(engine_dir, settings['study_name']+'_'+T_ID+'_results'+kind+'_*.csv'))[0]
+                exact = pd.read_csv(exact_file)
+                exact = exact.set_index(exact['subj_name'].astype(str).str.strip())
+                if level == 'date':
+                    preview = preview[preview['sampled_fraction'] < 1]
+                for column in [column[:-len('_est')] for column in preview.columns if column.endswith('_est')]:
+                    truth = pd.to_numeric(exact[column], errors='coerce').reindex(preview['subj_name']).to_numpy()
+                    low = preview[column+'_ci_low'].to_numpy(dtype='float64')
+                    high = preview[column+'_ci_high'].to_numpy(dtype='float64')
+                    checked = ~np.isnan(truth) & ~np.isnan(low) & ~np.isnan(high)
+                    counts[level][0] += int((checked & (low <= truth + atol) & (truth - atol <= high)).sum())
+                    counts[level][1] += int(checked.sum())
+    return {level: tuple(count) for level, count in counts.items()}
+
+
+def best_record():
+    """Return the best recorded (speedup, memory ratio) of previous passing runs, or (0, 0)."""
+    if not os.path.exists(record_file):
+        return 0.0, 0.0
+    best_speedup, best_memory = 0.0, 0.0
+    for line in open(record_file):
+        record = json.loads(line)
+        if record['passed']:
+            best_speedup = max(best_speedup, record['speedup'])
+            best_memory = max(best_memory, record['memory_ratio'])
+    return best_speedup, best_memory
+
+
+##### PROGRAM BODY BELOW #####
+if __name__ == '__main__':
+    os.makedirs(harness_dir, exist_ok=True)
+    run_dir = pathjoin(harness_dir, 'run_'+dateandtime)
+    os.makedirs(run_dir)
+    synthetic = len(fixture_dirs) == 0 #golden files only exist for the synthetic fixtures
+    if synthetic:
+        build_fixtures(pathjoin(run_dir, 'fixtures'))
+        fixture_dirs = [pathjoin(run_dir, 'fixtures')]
+    failures = []
+    legacy_seconds, engine_seconds, legacy_peak, engine_peak = 0.0, 0.0, 0, 0
+    preview_counts = {'date': (0, 0), 'subject': (0, 0)} #(intervals containing the exact result, intervals checked)
+    for n, data_dir in enumerate(fixture_dirs):
+        data_dir = os.path.abspath(data_dir)
+        legacy_dir = pathjoin(run_dir, 'legacy_'+str(n)) #results of the first timed run are compared
+        engine_dir = pathjoin(run_dir, 'engine_'+str(n))
+        legacy_times, engine_times = [], []
+        for r in range(timing_repeats): #each run writes to its own folder (log files are never overwritten)
+            out_dir = legacy_dir if r == 0 else legacy_dir+'_'+str(r)
+            os.makedirs(out_dir)
+            settings, seconds = timed(run_legacy, data_dir, out_dir)
+            legacy_times.append(seconds)
+            out_dir = engine_dir if r == 0 else engine_dir+'_'+str(r)
+            os.makedirs(out_dir)
+            engine_times.append(timed(run_engine, data_dir, out_dir, settings)[1])
+        legacy_seconds += min(legacy_times)
+        engine_seconds += min(engine_times)
+        os.makedirs(legacy_dir+'_mem')
+        os.makedirs(engine_dir+'_mem')
+        legacy_peak += peak_memory(run_legacy, data_dir, legacy_dir+'_mem')
+        engine_peak += peak_memory(run_engine, data_dir, engine_dir+'_mem', settings)
+        failures.extend(compare_dirs(legacy_dir, engine_dir))
+        for k, overrides in enumerate(parity_settings): #untimed parity runs with non-default settings
+            os.makedirs(legacy_dir+'_parity_'+str(k))
+            os.makedirs(engine_dir+'_parity_'+str(k))
+            parity_namespace = run_legacy(data_dir, legacy_dir+'_parity_'+str(k), overrides)
+            run_engine(data_dir, engine_dir+'_parity_'+str(k), parity_namespace)
+            failures.extend(compare_dirs(legacy_dir+'_parity_'+str(k), engine_dir+'_parity_'+str(k), str(overrides)+' '))
+        if synthetic:
+            for golden_set, overrides in golden_settings.items(): #both sides against the committed golden results
+                legacy_golden, engine_golden = legacy_dir, engine_dir
+                if overrides != {}:
+                    legacy_golden, engine_golden = legacy_dir+'_golden_'+golden_set, engine_dir+'_golden_'+golden_set
+                    os.makedirs(legacy_golden)
+                    os.makedirs(engine_golden)
+                    golden_namespace = run_legacy(data_dir, legacy_golden, overrides)
+                    run_engine(data_dir, engine_golden, golden_namespace)
+                if update_golden == 1:
+                    write_golden(golden_set, legacy_golden, settings['study_name'])
+                for side, result_dir in (('script', legacy_golden), ('engine', engine_golden)):
+                    failures.extend(compare_golden(golden_set, result_dir, settings['study_name'],
+                                                   'golden '+golden_set+' ('+side+') '))
+        os.makedirs(engine_dir+'_preview')
+        for level, (contained, checked) in preview_coverage(data_dir, engine_dir, engine_dir+'_preview',
+                                                             settings).items():
+            preview_counts[level] = (preview_counts[level][0] + contained, preview_counts[level][1] + checked)
+    coverage = {level: contained/checked if checked > 0 else None for level, (contained, checked) in
+                preview_counts.items()}
+    for level, fraction in coverage.items():
+        if fraction is not None and fraction < min_preview_coverage:
+            failures.append('preview intervals contain '+format(fraction, '.1%')+' of the '+level+' results, below '
+                            +'the minimum of '+format(min_preview_coverage, '.0%'))
+    speedup = legacy_seconds/engine_seconds if engine_seconds > 0 else float('inf')
+    memory_ratio = legacy_peak/engine_peak if engine_peak > 0 else float('inf')
+    best_speedup, best_memory = best_record()
+    if speedup < min_speedup:
+        failures.append('speedup '+format(speedup, '.2f')+'x is below the minimum of '+str(min_speedup)+'x')
+    if memory_ratio < min_memory_ratio:
+        failures.append('memory ratio '+format(memory_ratio, '.2f')+'x is below the minimum of '+str(min_memory_ratio)+'x')
+    if speedup < regression_margin*best_speedup:
+        failures.append('speedup '+format(speedup, '.2f')+'x regressed from the best recorded '+format(best_speedup, '.2f')+'x')
+    if memory_ratio < regression_margin*best_memory:
+        failures.append('memory ratio '+format(memory_ratio, '.2f')+'x regressed from the best recorded '+format(best_memory, '.2f')+'x')
+    record = {'dateandtime': dateandtime, 'fixtures': fixture_dirs, 'legacy_seconds': legacy_seconds,
+              'engine_seconds': engine_seconds, 'speedup': speedup, 'legacy_peak_bytes': legacy_peak,
+              'engine_peak_bytes': engine_peak, 'memory_ratio': memory_ratio, 'preview_coverage': coverage,
+              'preview_checked': {level: checked for level, (contained, checked) in preview_counts.items()},
+              'preview_confidence': preview_confidence, 'mismatches': len(failures), 'passed': len(failures) == 0}
+    with open(record_file, 'a') as f:
+        f.write(json.dumps(record)+'\n')
+    print('AcuWand Harness '+dateandtime)
+    print('Analysis script: '+format(legacy_seconds, '.2f')+' s, peak '+format(legacy_peak/1e6, '.1f')+' MB')
+    print('Engine:          '+format(engine_seconds, '.2f')+' s, peak '+format(engine_peak/1e6, '.1f')+' MB')
+    print('Speedup '+format(speedup, '.2f')+'x, memory ratio '+format(memory_ratio, '.2f')+'x')
+    print('Preview intervals (nominal '+format(preview_confidence, '.0%')+') contain the exact result for '
+          +', '.join(('n/a' if coverage[level] is None else format(coverage[level], '.1%'))+' of '+str(checked)+' '
+                     +level+' results' for level, (contained, checked) in preview_counts.items()))
+    for failure in failures:
+        print('FAIL '+failure)
+    print('PASSED' if len(failures) == 0 else 'FAILED ('+str(len(failures))+')')
+    if len(failures) == 0 and keep_runs == 0:
+        shutil.rmtree(run_dir) #fixtures and outputs of a passing run are not needed
+    else:
+        print('Run folder: '+run_dir)
+    sys.exit(0 if len(failures) == 0 else 1)
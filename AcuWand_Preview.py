@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Provides a fast preview of 'AcuWand Analysis' results, estimated from a sample of rows of each date.
+
+AcuWand Preview follows the file discovery, date grouping, and merging rules of the analysis, but instead of parsing
+every row it seeks to stratified random byte offsets within each date's parts and reads a short block of rows at each,
+a fixed fraction of the rows of every date (only dates of a few blocks are read in full). Of the dates with compressed
+or archived parts, which cannot be seeked, it reads only a random share in full. Pressure statistics and treatment time
+are estimated by date and by subject, with cluster bootstrap confidence intervals (widened to t intervals where dates
+were left unread); the log reports their nominal level and the coverage last measured by AcuWand Harness. All output is marked as an estimate (_PREVIEW_ESTIMATE_ files) and is meant for quick sanity checks, not for
+reporting.
+"""
+
+##### IMPORT BELOW #####
+from os.path import join as pathjoin
+from os.path import sep
+import os
+import math
+import json
+import datetime
+from statistics import NormalDist
+import pandas as pd
+import numpy as np
+from AcuWand_Tools import (find_duplicate_parts, data_source, write_table, segment_shape_stats, pressure_stats,
+                           rows_per_sec, repeat_rows, glob_folders, not_folders)
+from AcuWand_Engine import subject_day_list, group_by_date, merged_day_name, read_merged_day, treatment_rows
+
+__author__ = "Noah C Waller"
+__copyright__ = "Copyright Pending"
+__credits__ = ["Noah C Waller"]
+__license__ = "PSF License Agreement"
+__version__ = "2.1"
+__year__ = "2023"
+__maintainer__ = "Noah C Waller"
+__email__ = "ncwaller@med.umich.edu"
+__status__ = "Production"
+
+##### INITIALIZE BELOW #####
+study_name='study_name' #specify study name
+removeduplicates = 1 #use 1 to exclude duplicate .csv parts of a date (as in the analysis script)
+output_format = 'csv' #result file format: 'csv', 'csv.gz', 'parquet', 'feather' (as in the analysis script)
+lower_cutoff = -10 #define lower floor cutoff for pressure calculations
+upper_cutoff = 10 #define upper ceiling cutoff for pressure calculations
+lower_range_fordel = -0.1 #define lower end of range of values to remove consecutive appearances
+upper_range_fordel = 0.1 #define upper end of range of values to remove consecutive appearances
+preview_fraction = 0.05 #fraction of the rows of each date read, in blocks spread over equal byte ranges (strata)
+preview_block_rows = 64 #consecutive rows read at each sampled offset (6.4 seconds)
+preview_min_blocks = 16 #fewest sampled blocks per date (the bootstrap resamples blocks, so it needs enough of them)
+preview_max_blocks = 64 #most sampled blocks per date; larger dates are read in longer blocks instead (fewer seeks)
+preview_max_fraction = 0.5 #dates where preview_min_blocks blocks are over this fraction of the rows are read in full
+preview_date_fraction = 0.25 #fraction of the dates of a subject with compressed or archived parts (which cannot be
+                             #seeked) that are read in full (at least 2, chosen at random); they stand for the others
+preview_resamples = 200 #number of cluster bootstrap resamples for the confidence intervals
+preview_confidence = 0.95 #confidence level of the reported intervals
+preview_seed = 0 #seed of the sampled offsets and resamples (same seed, same preview)
+dateandtime = str(datetime.datetime.now().strftime('%Y%m%d_%H%M%S')) #initializes date and time here
+
+##### DIRECTORIES BELOW #####
+data_dir = pathjoin(sep) #define input data directory
+log_dir = pathjoin(data_dir) #define output directory to save log file output
+record_file = pathjoin(os.path.dirname(os.path.abspath(__file__)), 'harness_record.jsonl') #AcuWand Harness runs, with
+                                                                     #the measured coverage of the preview intervals
+
+
+##### ROW SAMPLING BELOW #####
+blank_bytes = np.isin(np.arange(256), np.frombuffer(b' \t\n\r\x0b\x0c', dtype='uint8')) #bytes stripped from rows
+
+
+def _parse_line(line):
+    """Return the first column of a data line as a float pressure value (NaN when it is not a number)."""
+    try:
+        return float(line.split(b',')[0])
+    except ValueError:
+        return np.nan
+
+
+def _parse_lines(lines, columns=True):
+    """Return the first column of data lines as float pressure values, parsed together (line by line only when a value
+    is not a number, which becomes NaN). Lines are taken as a single value when columns is False."""
+    fields = [line.split(b',', 1)[0] for line in lines] if columns else lines
+    try:
+        return np.array(fields, dtype='S').astype('float64')
+    except ValueError:
+        return np.array([_parse_line(line) for line in lines], dtype='float64')
+
+
+def _split_rows(data):
+    """Return (rows, bounds) for the lines of data: the numbers of the non-blank lines, and the offsets where each line
+    starts (line i is data[bounds[i]:bounds[i+1] - 1]). Lines are found on the bytes rather than one by one."""
+    codes = np.frombuffer(data, dtype='uint8')
+    bounds = np.concatenate(([0], np.flatnonzero(codes == 10) + 1, [len(data) + 1]))
+    filled = np.concatenate(([0], np.cumsum(~blank_bytes[codes]))) #non-blank bytes before each offset
+    return np.flatnonzero(filled[bounds[1:] - 1] > filled[bounds[:-1]]), bounds
+
+
+def _row_values(data, rows):
+    """Return the values of lines rows of data (see _split_rows)."""
+    lines = data.split(b'\n')
+    return _parse_lines([lines[i] for i in rows], b',' in data)
+
+
+def _read_rows(f, n_rows, row_bytes=8):
+    """Read up to n_rows non-blank rows from the current position of f and return their values (blank rows are skipped
+    by the analysis as well), leaving f just after the last row read (at the end of the file when fewer were left).
+
+    Rows are read in chunks of n_rows*row_bytes bytes (doubled until they hold n_rows rows; a pressure row is about 6
+    bytes) rather than line by line.
+    """
+    start = f.tell()
+    data = b''
+    chunk_bytes = max(1, n_rows*row_bytes)
+    while True:
+        more = f.read(chunk_bytes)
+        data += more
+        rows, bounds = _split_rows(data)
+        if more != b'':
+            rows = rows[rows < bounds.size - 2] #the last line may be cut off, it is complete once more is read
+        if rows.size >= n_rows or more == b'':
+            break
+        chunk_bytes = chunk_bytes*2
+    if rows.size < n_rows:
+        f.seek(start + len(data))
+        return _row_values(data, rows)
+    end = min(len(data), int(bounds[rows[n_rows - 1] + 1]))
+    f.seek(start + end)
+    return _row_values(data[:end], rows[:n_rows])
+
+
+def _read_blocks(f, offsets, data_start, block_rows, row_bytes=8):
+    """Return (values, block start, block end) for blocks of block_rows rows read from an open part, each starting at
+    the first full row after one of offsets (at the offset itself when it is data_start).
+
+    Every block is read as one chunk of bytes and the rows of all chunks are found together, so the cost per block is a
+    seek and a read; blocks that do not fit their chunk (long or blank rows, the end of the part) are read with
+    _read_rows.
+    """
+    chunks = []
+    shifts = [] #file position minus position in data, per chunk
+    size = 0
+    for offset in offsets:
+        f.seek(offset - 1 if offset > data_start else offset)
+        chunk = f.read((block_rows + 2)*row_bytes)
+        if offset == data_start: #a row starts at the offset, as after a line break
+            chunk = b'\n' + chunk
+        shifts.append(offset - 1 - size)
+        chunks.append(chunk)
+        size += len(chunk)
+    data = b''.join(chunks)
+    chunk_ends = np.cumsum([len(chunk) for chunk in chunks])
+    codes = np.frombuffer(data, dtype='uint8')
+    breaks = np.append(np.flatnonzero(codes == 10), len(data)) #line i ends at breaks[i] (the last one at the end)
+    filled = np.concatenate(([0], np.cumsum(~blank_bytes[codes]))) #non-blank bytes before each position
+    is_row = filled[breaks] > filled[np.concatenate(([0], breaks[:-1] + 1))]
+    rows_to = np.cumsum(is_row) #non-blank lines up to line i
+    first = np.searchsorted(breaks, chunk_ends - [len(chunk) for chunk in chunks]) #partial line before each block
+    last = np.searchsorted(rows_to, rows_to[first] + block_rows) #last line of each block
+    fits = breaks[np.minimum(last, breaks.size - 1)] < chunk_ends #the line break ending the block is in its chunk
+    in_block = np.zeros(breaks.size + 1, dtype='int64')
+    np.add.at(in_block, first[fits] + 1, 1)
+    np.add.at(in_block, last[fits] + 1, -1)
+    lines = data.split(b'\n')
+    values = _parse_lines([lines[i] for i in np.flatnonzero((np.cumsum(in_block[:-1]) > 0) & is_row)], b',' in data)
+    blocks = []
+    for k, offset in enumerate(offsets):
+        if fits[k]:
+            blocks.append((values[:block_rows], int(breaks[first[k]]) + 1 + shifts[k],
+                           int(breaks[last[k]]) + 1 + shifts[k]))
+            values = values[block_rows:]
+            continue
+        if offset > data_start:
+            f.seek(offset - 1)
+            f.readline() #move to the start of the next full row
+        else:
+            f.seek(offset)
+        block_start = f.tell()
+        blocks.append((_read_rows(f, block_rows, row_bytes), block_start, f.tell()))
+    return blocks
+
+
+def _count_equal_after(f, pos, value, limit):
+    """Return the number of consecutive rows equal to value starting at byte pos (counting stops above limit)."""
+    f.seek(pos)
+    values = _read_rows(f, limit + 1)
+    differs = np.flatnonzero(values != value)
+    return int(differs[0]) if differs.size != 0 else values.size
+
+
+def _count_equal_before(f, pos, data_start, value, limit, row_bytes=8):
+    """Return the number of consecutive rows equal to value ending just before byte pos (counting stops above limit)."""
+    step = (limit + 1)*row_bytes
+    while True:
+        start = max(data_start, pos - step)
+        f.seek(start)
+        data = f.read(pos - start)
+        rows = _split_rows(data)[0]
+        if start > data_start: #the first line may be partial, it is read whole with the next step
+            rows = rows[rows > 0]
+        values = _row_values(data, rows[-(limit + 1):])
+        differs = np.flatnonzero(values[::-1] != value)
+        if differs.size != 0:
+            return int(differs[0])
+        if values.size > limit or start == data_start:
+            return values.size
+        step = step*2
+
+
+def _removed_rows(f, blocks, data_start, lower_range_fordel, upper_range_fordel, threshold):
+    """Return the number of rows of each sampled block (values, start, end) of a part that the treatment time
+    calculation would remove.
+
+    Runs of equal values within the range around zero that touch an edge of their block are followed into the
+    neighbouring rows (only as far as needed to tell whether the run is longer than threshold), so a sampled row is
+    only counted when its whole run has more than threshold repeats; the first row of such a run is kept, as in the
+    analysis. Runs are not followed across parts.
+    """
+    values = np.concatenate([block[0] for block in blocks])
+    sizes = np.array([block[0].size for block in blocks])
+    block_ends = np.cumsum(sizes)
+    block_of = np.repeat(np.arange(len(blocks)), sizes)
+    starts = np.flatnonzero(np.concatenate(([True], (values[1:] != values[:-1]) | (block_of[1:] != block_of[:-1]))))
+    lengths = np.diff(np.append(starts, values.size))
+    run_block = block_of[starts]
+    at_start = starts == block_ends[run_block] - sizes[run_block]
+    at_end = starts + lengths == block_ends[run_block]
+    in_range = (values[starts] >= lower_range_fordel) & (values[starts] <= upper_range_fordel)
+    removed = np.zeros(len(blocks))
+    for run in np.flatnonzero(in_range & (at_start | at_end | (lengths - 1 > threshold))): #others are too short
+        value, length = values[starts[run]], int(lengths[run])
+        need = threshold + 2 - length #rows outside the block that make the run longer than threshold
+        after = _count_equal_after(f, blocks[run_block[run]][2], value, max(need - 1, 0)) if at_end[run] else 0
+        before = (_count_equal_before(f, blocks[run_block[run]][1], data_start, value, max(need - after - 1, 0))
+                  if at_start[run] else 0) #only whether there is one, once after is long enough
+        if before + length + after - 1 > threshold:
+            removed[run_block[run]] += length if before > 0 else length - 1
+    return removed
+
+
+def sample_day(list_v, n_strata, block_rows, lower_range_fordel, upper_range_fordel, rng, threshold=repeat_rows):
+    """Return a stratified cluster sample of the rows of a date as a dict of data_bytes and per-block arrays.
+
+    The data rows of each part (header excluded) are split into byte ranges in proportion to the part sizes, and
+    block_rows rows are read from the first full row after a random offset in each range (see _read_blocks). Per block,
+    the arrays hold the values read, their number of rows and bytes, and the number of rows removed from treatment time.
+    """
+    data_starts = []
+    data_sizes = []
+    for part in list_v:
+        with open(part, 'rb') as f:
+            f.readline() #header row
+            data_starts.append(f.tell())
+        data_sizes.append(os.path.getsize(part) - data_starts[-1])
+    data_bytes = sum(data_sizes)
+    blocks = {'values': [], 'rows': [], 'bytes': [], 'removed': []}
+    for part, data_start, data_size in zip(list_v, data_starts, data_sizes):
+        if data_size <= 0:
+            continue
+        part_strata = max(1, round(n_strata*data_size/data_bytes))
+        edges = data_start + np.arange(part_strata + 1)*data_size//part_strata
+        offsets = [int(rng.integers(low, high)) if high > low else int(low) for low, high in zip(edges[:-1], edges[1:])]
+        with open(part, 'rb') as f:
+            part_blocks = [block for block in _read_blocks(f, offsets, data_start, block_rows) if block[0].size != 0]
+            if len(part_blocks) == 0:
+                continue
+            blocks['values'].extend(values for values, block_start, block_end in part_blocks)
+            blocks['rows'].extend(values.size for values, block_start, block_end in part_blocks)
+            blocks['bytes'].extend(block_end - block_start for values, block_start, block_end in part_blocks)
+            blocks['removed'].extend(_removed_rows(f, part_blocks, data_start, lower_range_fordel, upper_range_fordel,
+                                                   threshold))
+    for key in ('rows', 'bytes', 'removed'):
+        blocks[key] = np.array(blocks[key], dtype='float64')
+    blocks['data_bytes'] = data_bytes
+    return blocks
+
+
+##### ESTIMATES BELOW #####
+def estimated_rows(list_v, sample_rows=preview_block_rows):
+    """Return the estimated number of data rows of a date, from the size of its parts and the length of the rows at the
+    start of its first part with data (0 when no part has data rows)."""
+    data_bytes = 0
+    row_bytes = 0.0
+    for part in list_v:
+        with open(part, 'rb') as f:
+            f.readline() #header row
+            data_start = f.tell()
+            if row_bytes == 0:
+                n_rows = _read_rows(f, sample_rows).size
+                if n_rows != 0:
+                    row_bytes = (f.tell() - data_start)/n_rows
+        data_bytes += os.path.getsize(part) - data_start
+    return data_bytes/row_bytes if row_bytes > 0 else 0.0
+
+
+def _wilson(fraction, n, confidence=preview_confidence):
+    """Return the (low, high) Wilson score interval of a proportion observed over n trials."""
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    centre = (fraction + z*z/(2*n))/(1 + z*z/n)
+    half = z*math.sqrt(fraction*(1 - fraction)/n + z*z/(4*n*n))/(1 + z*z/n)
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def _day_columns(stats, tx_rows):
+    """Return the per-date result columns (as in the bydate results) from pressure stats and treatment rows."""
+    with np.errstate(invalid='ignore'):
+        return {'mean_p': stats['mean'], 'median_p': stats['median'], 'skew_p': stats['skew'],
+                'kurtosis_p': stats['kurtosis'] - 3, 'sd_p': stats['sd'], 'IQR_p': stats['Q3'] - stats['Q1'],
+                'txtime_sec': tx_rows/rows_per_sec, 'txtime_min': tx_rows/rows_per_sec/60}
+
+
+def _resample_stats(kept, selections):
+    """Return the pressure statistics (mean, median, skew, kurtosis, sd, Q1, Q3 arrays) of every resample of blocks.
+
+    Each row of selections lists the block numbers of one resample. Resamples are evaluated from per-block sums and
+    value counts instead of being concatenated and sorted: moments come from the power sums of the selected blocks
+    (taken around the pooled mean) and quartiles from the cumulative counts of the distinct pooled values (pressure is
+    recorded to 2 decimals, so there are far fewer of these than sampled rows).
+    """
+    n_selections, n_blocks = selections.shape
+    multiplicity = np.bincount((np.arange(n_selections)[:, None]*n_blocks + selections).ravel(),
+                               minlength=n_selections*n_blocks).reshape(n_selections, n_blocks).astype('float64')
+    sizes = np.array([values.size for values in kept])
+    pool = np.concatenate(kept)
+    pool_block = np.repeat(np.arange(n_blocks), sizes)
+    shifted = pool - (pool.mean() if pool.size != 0 else 0.0)
+    powers = np.cumsum(np.vstack((shifted, shifted**2, shifted**3, shifted**4)), axis=1)
+    powers = np.diff(np.hstack((np.zeros((4, 1)), powers))[:, np.concatenate(([0], np.cumsum(sizes)))], axis=1)
+    t1, t2, t3, t4 = powers @ multiplicity.T #power sums of each resample (pool values are in block order)
+    n = multiplicity @ sizes
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu = t1/n #mean of the shifted values, central moment sums follow from the power sums
+        m2 = t2 - mu*t1
+        m3 = t3 - 3*mu*t2 + 2*mu*mu*t1
+        m4 = t4 - 4*mu*t3 + 6*mu*mu*t2 - 3*mu**3*t1
+        stats = {'mean': np.where(n > 0, mu + (pool.mean() if pool.size != 0 else 0.0), np.nan),
+                 'sd': np.where(n > 1, np.sqrt(np.maximum(m2, 0)/(n - 1)), np.nan)}
+    stats['skew'], stats['kurtosis'] = segment_shape_stats(n, m2, m3, m4)
+    distinct, inverse = np.unique(pool, return_inverse=True)
+    counts = np.bincount(pool_block*distinct.size + inverse, minlength=n_blocks*distinct.size).astype('float64')
+    cumulative = multiplicity @ np.cumsum(counts.reshape(n_blocks, distinct.size), axis=1) #rows up to each value
+    offsets = np.arange(n_selections)*(n.max() + 1) #rows are searched at once, shifted apart
+    flat = (cumulative + offsets[:, None]).ravel()
+    last = max(distinct.size - 1, 0)
+
+    def value_at(index): #value at expanded row index (0-based) of each resample
+        position = np.searchsorted(flat, index + offsets, side='right') - np.arange(n_selections)*distinct.size
+        return distinct[np.clip(position, 0, last)] if pool.size != 0 else np.full(n_selections, np.nan)
+
+    for key, q in (('median', 0.5), ('Q1', 0.25), ('Q3', 0.75)):
+        h = np.maximum(n - 1, 0)*q
+        lo = np.floor(h)
+        t = h - lo
+        a = value_at(lo)
+        b = value_at(np.minimum(lo + 1, np.maximum(n - 1, 0)))
+        stats[key] = np.where(n > 0, np.where(t >= 0.5, b - (b - a)*(1 - t), a + (b - a)*t), np.nan)
+    return stats
+
+
+def estimate_day(list_v, lower_cutoff, upper_cutoff, lower_range_fordel, upper_range_fordel, rng, sample=True,
+                 n_strata=preview_min_blocks, block_rows=preview_block_rows, n_resamples=preview_resamples,
+                 confidence=preview_confidence):
+    """Return (estimates, replicates, sampled_fraction, tx_bounds) for a date.
+
+    estimates maps each bydate result column (and max_p, the largest value read, a lower bound of the date maximum when
+    sampled) to its estimate, and replicates each column but max_p to an array of n_resamples cluster bootstrap
+    replicates (blocks are resampled with replacement). Dates are read in full when sample is False or fewer than 2
+    blocks could be read; their replicates all equal the exact result. Long idle runs that no block falls in are never
+    seen by the bootstrap, so tx_bounds gives the (low, high) treatment seconds implied by the Wilson interval of the
+    fraction of sampled rows removed as idle, which the treatment time intervals are widened to.
+    """
+    blocks = None
+    if sample:
+        blocks = sample_day(list_v, n_strata, block_rows, lower_range_fordel, upper_range_fordel, rng)
+        if len(blocks['values']) < 2:
+            blocks = None
+    if blocks is None:
+        values = read_merged_day(list_v)
+        kept = values[(values > lower_cutoff) & (values < upper_cutoff)]
+        tx_rows = treatment_rows(values, lower_range_fordel, upper_range_fordel)[0]
+        estimates = _day_columns(pressure_stats(kept), tx_rows)
+        estimates['max_p'] = kept.max() if kept.size != 0 else np.nan
+        replicates = {key: np.full(n_resamples, value, dtype='float64') for key, value in estimates.items()}
+        return estimates, replicates, 1.0, (tx_rows/rows_per_sec, tx_rows/rows_per_sec)
+    kept = [values[(values > lower_cutoff) & (values < upper_cutoff)] for values in blocks['values']]
+    n_blocks = len(kept)
+    selections = np.vstack((np.arange(n_blocks), rng.integers(0, n_blocks, (n_resamples, n_blocks)))) #row 0: the sample
+    rows_per_byte = blocks['rows'][selections].sum(axis=1)/blocks['bytes'][selections].sum(axis=1)
+    tx_rows = blocks['data_bytes']*rows_per_byte*(1 - blocks['removed'][selections].sum(axis=1)
+                                                 /blocks['rows'][selections].sum(axis=1))
+    columns = _day_columns(_resample_stats(kept, selections), tx_rows)
+    estimates = {key: value[0] for key, value in columns.items()}
+    replicates = {key: value[1:] for key, value in columns.items()}
+    pooled = np.concatenate(kept)
+    estimates['max_p'] = pooled.max() if pooled.size != 0 else np.nan
+    low, high = _wilson(blocks['removed'].sum()/blocks['rows'].sum(), n_blocks, confidence)
+    date_rows = blocks['data_bytes']*rows_per_byte[0]
+    return (estimates, replicates, float(blocks['bytes'].sum()/blocks['data_bytes']),
+            (date_rows*(1 - high)/rows_per_sec, date_rows*(1 - low)/rows_per_sec))
+
+
+def _interval(replicates, confidence=preview_confidence):
+    """Return the (low, high) percentile interval of bootstrap replicates, ignoring NaN replicates (NaN when all are).
+
+    For a 2-D array, returns arrays of the intervals of each row, found with one sort (linear interpolation, as
+    np.nanpercentile).
+    """
+    replicates = np.asarray(replicates, dtype='float64')
+    ordered = np.sort(np.atleast_2d(replicates), axis=1) #NaN replicates sort last
+    n = (~np.isnan(ordered)).sum(axis=1)
+    rows = np.arange(ordered.shape[0])
+    bounds = []
+    for q in ((1 - confidence)/2, (1 + confidence)/2):
+        h = np.maximum(n - 1, 0)*q
+        lo = np.floor(h).astype('int64')
+        a = ordered[rows, lo]
+        b = ordered[rows, np.minimum(lo + 1, np.maximum(n - 1, 0))]
+        bounds.append(np.where(n > 0, a + (b - a)*(h - lo), np.nan))
+    if replicates.ndim == 1:
+        return bounds[0][0], bounds[1][0]
+    return bounds[0], bounds[1]
+
+
+def _subject_mean(day_values, weights=1.0):
+    """Weighted mean over dates ignoring NaN dates, as the subject means of the analysis (NaN when no date has a value).
+
+    day_values holds one row per date; weights (one row per date, or a scalar) scale dates that stand for unread ones.
+    """
+    day_values = np.asarray(day_values, dtype='float64')
+    weights = np.where(np.isnan(day_values), 0.0, np.broadcast_to(weights, day_values.shape))
+    total = weights.sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        return np.where(total > 0, (np.nan_to_num(day_values)*weights).sum(axis=0)/np.where(total > 0, total, 1), np.nan)
+
+
+def _t_quantile(p, df):
+    """Return the p quantile of Student's t distribution with df degrees of freedom (exact for df 1 and 2, else the
+    Cornish-Fisher expansion, within 0.03 of the exact value at df 3 and closer above)."""
+    if df == 1:
+        return math.tan(math.pi*(p - 0.5))
+    if df == 2:
+        return (2*p - 1)/math.sqrt(2*p*(1 - p))
+    z = NormalDist().inv_cdf(p)
+    return (z + (z**3 + z)/(4*df) + (5*z**5 + 16*z**3 + 3*z)/(96*df**2)
+            + (3*z**7 + 19*z**5 + 17*z**3 - 15*z)/(384*df**3))
+
+
+def _subject_estimate(estimates, replicates, tx_bounds, read_unseekable, n_unseekable, confidence=preview_confidence):
+    """Return (estimate, low, high) of a subject mean over dates from the dates that were read.
+
+    estimates and replicates hold one row per date read, and read_unseekable marks the dates with compressed or archived
+    parts, which stand for all n_unseekable such dates of the subject. The interval is the bootstrap interval of the
+    dates, widened to tx_bounds (treatment time) and, when only some unseekable dates were read, to a finite-population
+    t interval that adds the spread between them to the bootstrap variance (NaN when fewer than 2 of them have a value).
+    """
+    weights = np.where(read_unseekable, n_unseekable/max(read_unseekable.sum(), 1), 1.0)[:, None]
+    estimate = _subject_mean(estimates[:, None], weights)[0]
+    resampled = _subject_mean(replicates, weights)
+    low, high = _interval(resampled, confidence)
+    if tx_bounds is not None:
+        low = np.fmin(low, _subject_mean(tx_bounds[:, :1], weights)[0])
+        high = np.fmax(high, _subject_mean(tx_bounds[:, 1:], weights)[0])
+    if read_unseekable.sum() < n_unseekable: #dates were sampled
+        read_values = estimates[read_unseekable][~np.isnan(estimates[read_unseekable])]
+        if read_values.size < 2:
+            return estimate, np.nan, np.nan
+        has_value = ~np.isnan(estimates)
+        share = (weights[:, 0]*has_value)[read_unseekable].sum()/(weights[:, 0]*has_value).sum() #of the subject mean
+        variance = share**2*read_values.var(ddof=1)/read_values.size*(1 - read_values.size/n_unseekable)
+        if not np.isnan(resampled).all():
+            variance += np.nanvar(resampled, ddof=1)
+        half = _t_quantile(0.5 + confidence/2, read_values.size - 1)*math.sqrt(variance)
+        low, high = np.fmin(low, estimate - half), np.fmax(high, estimate + half)
+    return estimate, low, high
+
+
+def harness_coverage(confidence=preview_confidence):
+    """Return the last AcuWand Harness record (from record_file) that measured the coverage of preview intervals at this
+    confidence level, or None."""
+    if not os.path.exists(record_file):
+        return None
+    last = None
+    for line in open(record_file):
+        record = json.loads(line)
+        if record.get('preview_confidence') == confidence and None not in record['preview_coverage'].values():
+            last = record
+    return last
+
+
+##### PREVIEW BELOW #####
+def run_preview(data_dir, out_dir, study_name='study_name', subject_pattern='BPCR01*', lower_cutoff=-10,
+                upper_cutoff=10, lower_range_fordel=-0.1, upper_range_fordel=0.1, remove_duplicates=True,
+                output_format='csv', dateandtime=None, fraction=preview_fraction, block_rows=preview_block_rows,
+                min_blocks=preview_min_blocks, max_blocks=preview_max_blocks, max_fraction=preview_max_fraction,
+                date_fraction=preview_date_fraction, n_resamples=preview_resamples, confidence=preview_confidence,
+                seed=preview_seed):
+    """Estimate the results of every T# folder of data_dir and write the log and _PREVIEW_ESTIMATE_ files to out_dir.
+
+    Each date is sampled by blocks of block_rows rows, as many as make up fraction of its (estimated) rows but at least
+    min_blocks (and at most max_blocks, which are then made longer); dates where min_blocks blocks are over max_fraction
+    of the rows are read in full. Of the dates with
+    compressed or archived parts, only date_fraction (at least 2) per subject, chosen at random, are read in full; they
+    stand for the others in the subject means, which are listed with NaN estimates and a sampled_fraction of 0.
+    Estimated columns are written with confidence intervals (_est, _ci_low, _ci_high columns); max_p is reported as
+    max_p_lower_bound only. Returns a dict mapping each T# folder to its (bydate, bysubj) DataFrames; the log file path
+    is stored under 'log'.
+    """
+    if dateandtime is None:
+        dateandtime = str(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+    rng = np.random.default_rng(seed)
+    record = harness_coverage(confidence)
+    if record is not None:
+        coverage = ('In the last AcuWand Harness run ('+record['dateandtime']+', on its synthetic fixtures) they '
+                    +'contained the exact result for '+format(record['preview_coverage']['date'], '.0%')+' of sampled '
+                    +'date values and '+format(record['preview_coverage']['subject'], '.0%')+' of subject values.')
+    else:
+        coverage = 'Their achieved coverage has not been measured at this level (run AcuWand Harness).'
+    logfilename = pathjoin(out_dir, study_name+'_PREVIEW_ESTIMATE_log_'+dateandtime+'.txt')
+    log = ['\n'+'\n'+'##############################'+"\n"+
+           study_name+' PREVIEW (ESTIMATED RESULTS)'+"\n"+
+           'Script Ran at '+dateandtime+"\n"+
+           'Values are estimated from sampled blocks of '+str(block_rows)+' or more rows, '+str(fraction)
+           +' of the rows of each date ('+str(min_blocks)+' to '+str(max_blocks)+' blocks; dates where '
+           +str(min_blocks)+' blocks are over '+str(max_fraction)+' of the rows are read in full, and '
+           +str(date_fraction)+' of the dates with compressed or archived parts) with cluster bootstrap intervals of '
+           +'nominal '+str(int(confidence*100))+'% confidence.'+"\n"+
+           coverage+' Intervals miss more often than nominal for data with rare segments (e.g. idle spans or '
+           +'spikes) that few sampled blocks fall in.'+"\n"+
+           'Treatment time intervals are widened for idle runs that no sampled block fell in; max_p_lower_bound is the '
+           +'largest value read, not an estimate of the maximum.'+"\n"+
+           'Use AcuWand Analysis for final results.'+'\n'+
+           '##############################'+'\n'+'\n']
+    results = {'log': logfilename}
+    day_columns = ['mean_p', 'median_p', 'skew_p', 'kurtosis_p', 'sd_p', 'IQR_p', 'txtime_sec', 'txtime_min']
+    subj_columns = {'overall_mean_p': 'mean_p', 'overall_sd_p': 'sd_p', 'mean_txtime_sec': 'txtime_sec',
+                    'mean_txtime_min': 'txtime_min'}
+    T_list = glob_folders(data_dir, 'T*') #zipped T# and subject folders are listed as folders
+    for path in not_folders(data_dir, 'T*'):
+        log.append('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+    for folder in T_list:
+        T_ID = folder.split('/')[-1]
+        subjects_list = glob_folders(folder, subject_pattern)
+        for path in not_folders(folder, subject_pattern):
+            log.append('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+        log.append('\n'+'Subjects Included in AcuWand '+T_ID+' Preview: '+'\n'+
+                   str([subj.split('/')[-1] for subj in subjects_list])+'\n'+
+                   'Lower Cutoff for Pressure Values: '+str(lower_cutoff)+'\n'+
+                   'Upper Cutoff for Pressure Values: '+str(upper_cutoff)+'\n'+
+                   'Range for Consecutive Pressure Value Removal Around Zero: '+str(lower_range_fordel)+
+                   '/+'+str(upper_range_fordel)+'\n'+'\n')
+        rows_bydate = []
+        rows_bysubj = []
+        for subject_dir in subjects_list:
+            subj_name_strip = subject_dir.split('/')[-1]
+            format_style, day_list = subject_day_list(subject_dir, T_ID)
+            if format_style == 0:
+                log.append('No Readable Data for subject: '+subj_name_strip+'... skipping subject.'+"\n"+"\n")
+                continue
+            day_parts = {} #merged day name -> parts; a later date with the same name replaces it
+            for list_v in group_by_date(day_list, format_style):
+                day_parts[merged_day_name(list_v)] = list_v
+            if len(day_parts) == 0:
+                continue
+            day_names = sorted(day_parts, key=lambda name: name+'_full.csv') #_full.csv order
+            seekable = [all(data_source(part) == part for part in day_parts[day_name]) for day_name in day_names]
+            date_rows = [estimated_rows(day_parts[day_name], block_rows) if seekable[i] else 0.0
+                         for i, day_name in enumerate(day_names)]
+            day_blocks = [min(max_blocks, max(min_blocks, math.ceil(fraction*rows/block_rows))) for rows in date_rows]
+            day_block_rows = [max(block_rows, math.ceil(fraction*rows/n_blocks)) #the same fraction in fewer blocks
+                              for rows, n_blocks in zip(date_rows, day_blocks)]
+            sampled = [is_seekable and min_blocks*block_rows <= max_fraction*rows
+                       for is_seekable, rows in zip(seekable, date_rows)]
+            unseekable = [i for i, is_seekable in enumerate(seekable) if not is_seekable]
+            n_read = min(len(unseekable), max(2, math.ceil(date_fraction*len(unseekable))))
+            read_unseekable = (set(rng.choice(unseekable, n_read, replace=False).tolist()) if len(unseekable) != 0
+                               else set())
+            day_results = [] #(estimates, replicates, sampled fraction, treatment bounds) per date, None when not read
+            for i, day_name in enumerate(day_names):
+                if not seekable[i] and i not in read_unseekable:
+                    day_results.append(None)
+                    continue
+                list_v = day_parts[day_name]
+                if remove_duplicates:
+                    list_v = find_duplicate_parts(list_v)[0]
+                day_results.append(estimate_day(list_v, lower_cutoff, upper_cutoff, lower_range_fordel,
+                                                upper_range_fordel, rng, sampled[i], day_blocks[i],
+                                                day_block_rows[i], n_resamples, confidence))
+            for day_name, result in zip(day_names, day_results):
+                if result is None:
+                    rows_bydate.append([subj_name_strip+'_'+day_name, 0.0, np.nan]+[np.nan]*3*len(day_columns))
+                    continue
+                estimates, replicates, sampled_fraction, tx_bounds = result
+                row = [subj_name_strip+'_'+day_name, sampled_fraction, estimates['max_p']]
+                lows, highs = _interval([replicates[column] for column in day_columns], confidence)
+                for column, low, high in zip(day_columns, lows, highs):
+                    if column.startswith('txtime'):
+                        scale = 1 if column == 'txtime_sec' else 60
+                        low, high = np.fmin(low, tx_bounds[0]/scale), np.fmax(high, tx_bounds[1]/scale)
+                    row.extend([estimates[column], low, high])
+                rows_bydate.append(row)
+            read = [i for i, result in enumerate(day_results) if result is not None]
+            read_unseekable = np.array([not seekable[i] for i in read])
+            row = [subj_name_strip]
+            for column in subj_columns.values(): #subject values are means of the date values
+                scale = 1 if column == 'txtime_sec' else 60
+                row.extend(_subject_estimate(np.array([day_results[i][0][column] for i in read]),
+                                             np.array([day_results[i][1][column] for i in read]),
+                                             np.array([day_results[i][3] for i in read])/scale
+                                             if column.startswith('txtime') else None,
+                                             read_unseekable, len(unseekable), confidence))
+            row.append(len(day_names))
+            rows_bysubj.append(row)
+        df_bydate = pd.DataFrame(rows_bydate, columns=['subj_name', 'sampled_fraction', 'max_p_lower_bound']
+                                 +[column+suffix for column in day_columns for suffix in ('_est', '_ci_low', '_ci_high')])
+        df_bysubj = pd.DataFrame(rows_bysubj, columns=['subj_name']
+                                 +[column+suffix for column in subj_columns for suffix in ('_est', '_ci_low', '_ci_high')]
+                                 +['number_tx_days'])
+        write_table(df_bysubj, pathjoin(out_dir, study_name+'_'+T_ID+'_PREVIEW_ESTIMATE_bysubj_'+dateandtime+'.csv'),
+                    output_format)
+        write_table(df_bydate, pathjoin(out_dir, study_name+'_'+T_ID+'_PREVIEW_ESTIMATE_bydate_'+dateandtime+'.csv'),
+                    output_format)
+        results[T_ID] = (df_bydate, df_bysubj)
+    log.append('\n'+'##############################'+"\n"+
+               'END LOG (PREVIEW ESTIMATES)'+'\n'
+               '##############################'+'\n')
+    logfile = open(logfilename,'x')
+    logfile.write(''.join(log))
+    logfile.close()
+    return results
+
+
+if __name__ == '__main__':
+    run_preview(data_dir, log_dir, study_name=study_name, lower_cutoff=lower_cutoff, upper_cutoff=upper_cutoff,
+                lower_range_fordel=lower_range_fordel, upper_range_fordel=upper_range_fordel,
+                remove_duplicates=removeduplicates == 1, output_format=output_format, dateandtime=dateandtime)
@@ -0,0 +1,877 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Provides shared helper routines for the 'AcuWand Analysis' and 'AcuWand Validator' programs.
+
+AcuWand Tools holds the reusable pieces of the analysis pipeline that do not depend on script-level settings:
+- listing and streaming .csv data from compressed (.csv.gz, .csv.bz2, .csv.xz) files and .zip archives in place,
+  including zipped T# and subject folders
+- fingerprinting the decompressed data of .csv part files so that duplicate uploads (also a plain and a compressed or
+  archived copy) are excluded before merging, and detecting rows that overlap at the boundary between consecutive parts
+- applying the pressure cutoffs with per-day counts of the samples below, above, NaN, and kept
+- computing the pressure statistics of all days of a subject in one batch of segmented reductions
+- flagging short pressure spikes with a rolling-median (Hampel) filter
+- computing the statistics of very large merged days in parallel, newline-aligned chunks
+- segmenting each day into treatment sessions
+- writing result tables and cleaned samples in columnar or compressed formats
+"""
+
+##### IMPORT BELOW #####
+import os
+import io
+import re
+import gzip
+import bz2
+import lzma
+import zipfile
+import fnmatch
+import hashlib
+import math
+import warnings
+from glob import glob
+from os.path import join as pathjoin
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+try: #Parquet/Feather output needs pyarrow, which is optional
+    import pyarrow
+    has_pyarrow = True
+except ImportError:
+    has_pyarrow = False
+
+__author__ = "Noah C Waller"
+__copyright__ = "Copyright Pending"
+__credits__ = ["Noah C Waller"]
+__license__ = "PSF License Agreement"
+__version__ = "2.1"
+__year__ = "2023"
+__maintainer__ = "Noah C Waller"
+__email__ = "ncwaller@med.umich.edu"
+__status__ = "Production"
+
+##### INITIALIZE BELOW #####
+fingerprint_block = 65536 #number of bytes read from the start and end of a file for the quick fingerprint
+overlap_min_rows = 50 #minimum number of rows (5 seconds) shared at a part boundary before it is logged as an overlap
+rows_per_sec = 10 #AcuWand devices record 10 pressure values per second
+repeat_rows = 600 #consecutive repeats (60 seconds at 10 rows per second) before a run is checked for removal
+mad_scale = 1.4826 #scales the median absolute deviation to a standard deviation for normally distributed noise
+hampel_block = 16384 #number of windows reduced at once by the artifact filter (bounds memory on all-day recordings)
+segment_block = 2**24 #values reduced at once when the statistics of all days of a subject are batched (about 19 days
+                      #of continuous recording, so a typical subject is one block; bounds temporaries on extreme ones)
+archive_levels = 2 #a folder may be zipped itself (subject.zip) or sit inside its zipped parent (T#.zip)
+compressed_openers = {'.csv.gz': gzip.open, '.csv.bz2': bz2.open, '.csv.xz': lzma.open} #single compressed .csv files
+source_maps = {} #folder -> (modification time, data_sources map) of the last listing, reused by data_source
+full_hashes = {} #(source, modification time, size) -> sha256 of the decompressed data of compressed and archived parts
+output_extensions = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet', 'feather': '.feather', 'npz': '.npz'}
+
+
+##### COMPRESSED AND ARCHIVED INPUTS BELOW #####
+def _add_source(sources, folder, name, source, origin):
+    """Add source to sources under folder/name, or under folder/name_origin.csv when another source holds that name.
+
+    origin (the compression type, or the archive and folder of a .zip member) keeps same-named files from different
+    places apart: the date and part fields of the name are unchanged, so both are merged as parts of their date (and an
+    identical copy is excluded by the duplicate check).
+    """
+    path = pathjoin(folder, name)
+    if path in sources:
+        tag = re.sub(r'[^0-9A-Za-z]+', '-', origin).strip('-') or 'copy'
+        path = pathjoin(folder, name[:-len('.csv')]+'_'+tag+'.csv')
+        copy = 2
+        while path in sources:
+            path = pathjoin(folder, name[:-len('.csv')]+'_'+tag+str(copy)+'.csv')
+            copy += 1
+    sources[path] = source
+
+
+def _zip_members(path):
+    """Return the file members of the .zip archive at path, without folders, hidden files and macOS metadata entries."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            members = archive.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return []
+    return [member for member in members if not (member.endswith('/') or member.startswith('__MACOSX/')
+                                                 or member.split('/')[-1].startswith('.'))] #skipped by glob as well
+
+
+def _folder_archives(folder):
+    """Return (zip path, member prefixes) for the .zip archives holding the contents of folder.
+
+    A folder may be zipped itself (folder.zip, e.g. a zipped subject folder) or be a folder inside its zipped parent
+    (parent.zip, e.g. a subject folder of a zipped T# folder). Members may sit at the archive root or inside a top
+    folder named like the archive, so both prefixes are tried (the longer first).
+    """
+    archives = []
+    head, below = os.path.normpath(folder), ''
+    for level in range(archive_levels):
+        if os.path.isfile(head+'.zip'):
+            archives.append((head+'.zip', [head.split('/')[-1]+'/'+below, below]))
+        below = head.split('/')[-1]+'/'+below
+        head = os.path.dirname(head)
+    return archives
+
+
+def _archive_members(zip_path, prefixes):
+    """Return (member, path below its prefix) for the file members of zip_path below one of prefixes."""
+    found = []
+    for member in _zip_members(zip_path):
+        for prefix in prefixes:
+            if member.startswith(prefix):
+                found.append((member, member[len(prefix):]))
+                break
+    return found
+
+
+def _folder_stamp(folder):
+    """Return the modification times of folder and of the archives holding it (a change means listing it again)."""
+    return (os.stat(folder).st_mtime_ns if os.path.isdir(folder) else None,
+            tuple(os.stat(zip_path).st_mtime_ns for zip_path, prefixes in _folder_archives(folder)))
+
+
+def data_sources(folder):
+    """Map the .csv data files of a folder to their source, listing compressed files and .zip archives in place.
+
+    Keys are the logical paths used by the analysis (folder/name.csv, so names, dates and parts are parsed exactly as for
+    plain .csv files). Values are the plain path, the compressed file path (name.csv.gz, .csv.bz2 or .csv.xz), or a
+    (zip path, member) pair for .csv members of a .zip archive (read from the archive listing, folders inside the archive
+    are flattened). The archives are those inside folder and those holding a zipped folder (see glob_folders). Plain
+    files keep their name; a compressed file or .zip member whose name is already taken (e.g. the same name in two
+    folders of an archive) is listed as name_<origin>.csv instead of being dropped (see _add_source).
+    """
+    sources = {}
+    stamp = _folder_stamp(folder) #taken before listing, see _folder_sources
+    paths = sorted(glob(pathjoin(folder, '*')))
+    for path in paths: #plain files first
+        if path.endswith('.csv'):
+            sources[path] = path
+    for path in paths: #then single compressed files
+        for ext, opener in compressed_openers.items():
+            if path.endswith(ext):
+                _add_source(sources, folder, path.split('/')[-1][:-len(ext)]+'.csv', path, ext[len('.csv.'):])
+    archived = [(path, [(member, member) for member in _zip_members(path)]) for path in paths
+                if path.lower().endswith('.zip')] #then members of .zip archives in the folder
+    archived.extend((zip_path, _archive_members(zip_path, prefixes)) #and of the archives holding a zipped folder
+                    for zip_path, prefixes in _folder_archives(folder))
+    for zip_path, members in archived:
+        for member, below in members:
+            name = below.split('/')[-1]
+            if name.endswith('.csv'):
+                member_folder = below[:-len(name)].strip('/')
+                _add_source(sources, folder, name, (zip_path, member), member_folder if member_folder != '' else
+                            zip_path.split('/')[-1][:-len('.zip')])
+    source_maps[os.path.abspath(folder)] = (stamp, sources) #absolute, the analysis script changes folders
+    return sources
+
+
+def _folder_sources(folder, path=None):
+    """Return the data_sources map of folder, reusing the last listing while the folder is unchanged.
+
+    The folder is listed again when its modification time (or that of an archive holding it) changed, or when path is
+    not in the last listing, so folders and .zip archives are listed once per subject rather than once per file.
+    """
+    stamp, sources = source_maps.get(os.path.abspath(folder), (None, None))
+    if sources is None or (path is not None and path not in sources) or stamp != _folder_stamp(folder):
+        sources = data_sources(folder)
+    return sources
+
+
+def glob_folders(folder, pattern):
+    """Return the folders in folder whose name matches pattern, like glob(pathjoin(folder, pattern)) for folders.
+
+    Zipped folders are listed as the folder they hold: name.zip as folder/name, and the folders inside a zipped folder
+    (e.g. the subject folders of T1.zip) as folder/<subfolder>; their .csv files are then listed by data_sources. A
+    folder and an archive with the same name are listed once, with the contents of both. Other files are left out (see
+    not_folders).
+    """
+    folders = set(path for path in glob(pathjoin(folder, pattern)) if os.path.isdir(path))
+    for path in glob(pathjoin(folder, '*.zip')):
+        name = path.split('/')[-1][:-len('.zip')]
+        if fnmatch.fnmatchcase(name, pattern) and zipfile.is_zipfile(path):
+            folders.add(pathjoin(folder, name))
+    for zip_path, prefixes in _folder_archives(folder):
+        for member, below in _archive_members(zip_path, prefixes):
+            if '/' in below and fnmatch.fnmatchcase(below.split('/')[0], pattern):
+                folders.add(pathjoin(folder, below.split('/')[0]))
+    return sorted(folders)
+
+
+def not_folders(folder, pattern):
+    """Return the paths in folder matching pattern that are neither folders nor zipped folders (skipped as such)."""
+    return [path for path in sorted(glob(pathjoin(folder, pattern))) if not os.path.isdir(path) and
+            not (path.endswith('.zip') and zipfile.is_zipfile(path))]
+
+
+def glob_data(folder, pattern):
+    """Return the logical .csv paths in folder whose file name matches pattern, like glob(pathjoin(folder, pattern)).
+
+    Compressed files and .zip members are matched on their .csv name, so the naming formats apply unchanged.
+    """
+    return [path for path in _folder_sources(folder) if fnmatch.fnmatchcase(path.split('/')[-1], pattern)]
+
+
+def data_source(path):
+    """Return the source of a logical .csv path (see data_sources); plain files are returned as is."""
+    if os.path.isfile(path):
+        return path
+    source = _folder_sources(os.path.dirname(path), path).get(path)
+    if source is None:
+        raise FileNotFoundError(path)
+    return source
+
+
+@contextmanager
+def open_data(path):
+    """Open a logical .csv path as a binary stream, decompressing on the fly (no temporary files are written)."""
+    source = data_source(path)
+    if isinstance(source, tuple):
+        with zipfile.ZipFile(source[0]) as archive:
+            with archive.open(source[1]) as f:
+                yield f
+        return
+    for ext, opener in compressed_openers.items():
+        if source.endswith(ext):
+            with opener(source, 'rb') as f:
+                yield f
+            return
+    with open(source, 'rb') as f:
+        yield f
+
+
+##### DUPLICATE PART DETECTION BELOW #####
+def part_fingerprint(path, block_size=fingerprint_block):
+    """Return a cheap (size, hash of first and last block) fingerprint of the decompressed data of a part file.
+
+    Every source is fingerprinted on its decompressed data, so a plain, a compressed, and an archived copy of the same
+    upload get the same fingerprint. Plain files are read at both ends only; compressed files and .zip members cannot
+    seek to their end, so they are streamed once and their full hash is kept for full_hash.
+    """
+    source = data_source(path)
+    digest = hashlib.sha1()
+    if source == path: #plain file
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            digest.update(f.read(block_size)) #first block
+            if size > block_size:
+                f.seek(max(size - block_size, block_size)) #last block (never re-reads the first block)
+                digest.update(f.read(block_size))
+        return (size, digest.hexdigest())
+    full = hashlib.sha256()
+    size, first, tail = 0, b'', b''
+    with open_data(path) as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            full.update(block)
+            if len(first) < block_size:
+                first = (first + block)[:block_size]
+            tail = (tail + block)[-block_size:]
+            size += len(block)
+    digest.update(first)
+    if size > block_size: #same bytes as the last block of a plain file: from max(size - block_size, block_size) on
+        digest.update(tail[max(size - block_size, block_size) - (size - len(tail)):])
+    full_hashes[_source_key(source)] = full.hexdigest()
+    return (size, digest.hexdigest())
+
+
+def _source_key(source):
+    """Return a key of a source that changes when the file holding it is modified (for the full_hashes cache)."""
+    stat = os.stat(source[0] if isinstance(source, tuple) else source)
+    return (source, stat.st_mtime_ns, stat.st_size)
+
+
+def full_hash(path, block_size=fingerprint_block):
+    """Return the sha256 of the whole (decompressed) data; only used when two quick fingerprints collide."""
+    key = _source_key(data_source(path))
+    if key in full_hashes: #compressed and archived parts are hashed while they are fingerprinted
+        return full_hashes[key]
+    digest = hashlib.sha256()
+    with open_data(path) as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_duplicate_parts(part_list):
+    """Split part_list into (kept, duplicates), where duplicates is a list of [duplicate, original] pairs.
+
+    Parts are fingerprinted by size plus a hash of the first and last blocks; only parts whose fingerprints collide are
+    read in full. The first occurrence (in part_list order) of identical data is kept.
+    """
+    kept = []
+    duplicates = []
+    seen_quick = {} #quick fingerprint -> list of kept parts with that fingerprint
+    seen_full = {} #full hash -> kept part (filled lazily, only on collision)
+    for part in part_list:
+        quick = part_fingerprint(part)
+        if quick not in seen_quick:
+            seen_quick[quick] = [part]
+            kept.append(part)
+            continue
+        for original in seen_quick[quick]: #quick fingerprints collide, confirm with a full hash
+            if original not in seen_full.values():
+                seen_full[full_hash(original)] = original
+        part_hash = full_hash(part)
+        if part_hash in seen_full:
+            duplicates.append([part, seen_full[part_hash]])
+        else:
+            seen_full[part_hash] = part
+            seen_quick[quick].append(part)
+            kept.append(part)
+    return kept, duplicates
+
+
+##### PART BOUNDARY OVERLAP BELOW #####
+def _tail_lines(path, block_size=fingerprint_block):
+    """Return the stripped data lines in the last block of a part file (header excluded).
+
+    Compressed and archived parts cannot seek to their end, so they are streamed and only the last two blocks are kept.
+    """
+    source = data_source(path)
+    if source == path: #plain file
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            f.seek(max(size - block_size, 0))
+            data = f.read()
+    else:
+        data = b''
+        with open_data(path) as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                data = data[-block_size:] + block
+        data = data[-block_size:] if len(data) > block_size else data
+    lines = data.decode('utf-8-sig', errors='replace').splitlines()
+    lines = lines[1:] #first line is either partial (large file) or the header row (whole file read)
+    return [line.strip() for line in lines if line.strip() != '']
+
+
+def _head_lines(path, block_size=fingerprint_block):
+    """Return the stripped data lines in the first block of a part file (header excluded)."""
+    with open_data(path) as f:
+        data = f.read(block_size + 1) #one extra byte tells whether the block holds the whole file
+    lines = data[:block_size].decode('utf-8-sig', errors='replace').splitlines()
+    if len(data) > block_size:
+        lines = lines[:-1] #last line of the block may be partial
+    return [line.strip() for line in lines[1:] if line.strip() != '']
+
+
+def boundary_overlap(prev_part, next_part, min_rows=overlap_min_rows, block_size=fingerprint_block):
+    """Return the number of rows at the end of prev_part that are repeated at the start of next_part (0 if none).
+
+    Only the last block of prev_part and the first block of next_part are read. Overlaps shorter than min_rows, or made
+    up of a single repeated value (e.g. an idle wand reading 0), are not reported since they are expected in normal data.
+    """
+    tail = _tail_lines(prev_part, block_size)
+    head = _head_lines(next_part, block_size)
+    if len(tail) < min_rows or len(head) < min_rows:
+        return 0
+    for start, line in enumerate(tail): #longest overlap first: earliest start in the tail matching the head
+        overlap = len(tail) - start
+        if overlap < min_rows:
+            break
+        if line != head[0] or overlap > len(head):
+            continue
+        if tail[start:] == head[:overlap]:
+            if len(set(head[:overlap])) == 1:
+                return 0
+            return overlap
+    return 0
+
+
+##### OUTPUT WRITERS BELOW #####
+def format_fallback(output_format, table=True):
+    """Return (format written, note) for the requested output_format; note is '' when the format is written as requested.
+
+    Parquet/Feather fall back to compressed .csv.gz (tables) or .npz (samples) when pyarrow is not installed, and .npz is
+    only used for sample arrays since result tables mix text and numbers.
+    """
+    if output_format not in output_extensions:
+        raise ValueError('Unknown output format: '+str(output_format)+' (use one of '+', '.join(output_extensions)+')')
+    written = output_format
+    if written in ('parquet', 'feather') and not has_pyarrow:
+        written = 'npz'
+    if written == 'npz' and table:
+        written = 'csv.gz'
+    if written == output_format:
+        return written, ''
+    reason = 'pyarrow is not installed' if output_format in ('parquet', 'feather') else '.npz only holds sample arrays'
+    return written, ('Output format '+output_format+' is not available for '
+                     +('result tables' if table else 'cleaned samples')+' ('+reason+')... written as '+written)
+
+
+def resolve_output_format(output_format, table=True):
+    """Return the format written for the requested output_format, with a warning when it falls back (format_fallback)."""
+    written, note = format_fallback(output_format, table)
+    if note != '':
+        warnings.warn(note, stacklevel=2)
+    return written
+
+
+def output_path(path, output_format):
+    """Swap the .csv extension of path for the extension of output_format."""
+    if path.endswith('.csv'):
+        path = path[:-len('.csv')]
+    return path+output_extensions[output_format]
+
+
+def write_table(df, path, output_format='csv'):
+    """Write a result table to path (named with .csv) in output_format and return the path written.
+
+    Plain .csv keeps the original layout exactly. Other formats keep a single subj_name column and store the statistics
+    as numbers instead of text, so tables reload without re-parsing. Numeric values are written as given; only text
+    values (e.g. the printed statistics of the analysis script) are parsed, so pass full-precision numbers where the text
+    was rounded for printing.
+    """
+    output_format = resolve_output_format(output_format, table=True)
+    path = output_path(path, output_format)
+    if output_format == 'csv':
+        df.to_csv(path)
+        return path
+    df = df.loc[:, ~df.columns.duplicated()].reset_index(drop=True) #subj_name is repeated by the pressure/txtime halves
+    for column in df.columns:
+        if column != 'subj_name' and df[column].dtype == object: #text such as ' 1.722583 ' or 'NaN', numbers are kept
+            df[column] = pd.to_numeric(df[column].map(lambda x: x.strip() if isinstance(x, str) else x), errors='coerce')
+    if output_format == 'csv.gz':
+        df.to_csv(path, index=False, compression='gzip')
+    elif output_format == 'parquet':
+        df.to_parquet(path, index=False)
+    elif output_format == 'feather':
+        df.to_feather(path)
+    return path
+
+
+def write_samples(values, path, output_format='csv'):
+    """Write one day of cleaned pressure samples to path (named with .csv) in output_format and return the path written."""
+    output_format = resolve_output_format(output_format, table=False)
+    path = output_path(path, output_format)
+    values = np.asarray(values, dtype='float64')
+    if output_format == 'npz':
+        np.savez_compressed(path, Pressure=values)
+        return path
+    df = pd.DataFrame({'Pressure': values})
+    if output_format == 'csv':
+        df.to_csv(path, index=False)
+    elif output_format == 'csv.gz':
+        df.to_csv(path, index=False, compression='gzip')
+    elif output_format == 'parquet':
+        df.to_parquet(path, index=False)
+    elif output_format == 'feather':
+        df.to_feather(path)
+    return path
+
+
+##### PRESSURE CUTOFFS BELOW #####
+def cutoff_mask(values, lower_cutoff, upper_cutoff):
+    """Return (kept, counts): the mask of values strictly between the cutoffs and the counts of each outcome.
+
+    Every sample is given one code (below: value <= lower_cutoff, above: value >= upper_cutoff and not below, nan: empty
+    or non-numeric rows, kept: the rest), and counts maps 'below', 'above', 'nan' and 'kept' to the number of samples
+    with each code, so they add up to the number of values given (blank lines are already skipped when a .csv is read).
+    kept selects the same rows as the chained filters Pressure > lower_cutoff and Pressure < upper_cutoff, so nothing is
+    kept when lower_cutoff >= upper_cutoff.
+    """
+    values = np.asarray(values, dtype='float64')
+    codes = (values >= upper_cutoff).view(np.int8) + 1 #1 kept, 2 above
+    codes[values <= lower_cutoff] = 0 #below takes precedence over above, as the lower cutoff is applied first
+    codes[np.isnan(values)] = 3
+    counts = np.bincount(codes, minlength=4)
+    return codes == 1, {'below': int(counts[0]), 'above': int(counts[2]), 'nan': int(counts[3]), 'kept': int(counts[1])}
+
+
+##### LARGE DAY CHUNKING BELOW #####
+def chunk_offsets(path, n_chunks):
+    """Return newline-aligned (start, end) byte ranges that split the data rows of path (header excluded) into n_chunks."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline() #header row
+        data_start = f.tell()
+        bounds = [data_start]
+        for k in range(1, n_chunks):
+            pos = data_start + k*(size - data_start)//n_chunks
+            if pos <= bounds[-1]:
+                continue
+            f.seek(pos - 1)
+            f.readline() #move to the start of the next full row
+            if f.tell() < size and f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def _read_chunk(path, start, end):
+    """Parse the first column of the rows between byte offsets start and end as float pressure values."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    try:
+        df = pd.read_csv(io.BytesIO(data), header=None, usecols=[0])
+    except pd.errors.EmptyDataError: #chunk of blank rows only
+        return np.zeros(0, dtype='float64')
+    return pd.to_numeric(df.iloc[:, 0], errors='coerce').to_numpy(dtype='float64') #non-numeric rows become NaN
+
+
+def _moments(values):
+    """Return (count, mean, M2, M3, M4) central moment sums of values."""
+    n = values.size
+    if n == 0:
+        return (0, 0.0, 0.0, 0.0, 0.0)
+    mean = values.mean()
+    dev = values - mean
+    dev2 = dev*dev
+    return (n, mean, dev2.sum(), (dev2*dev).sum(), (dev2*dev2).sum())
+
+
+def _combine_moments(a, b):
+    """Combine two (count, mean, M2, M3, M4) tuples (Chan et al. pairwise update)."""
+    na, ma, m2a, m3a, m4a = a
+    nb, mb, m2b, m3b, m4b = b
+    if na == 0:
+        return b
+    if nb == 0:
+        return a
+    n = na + nb
+    delta = mb - ma
+    mean = ma + delta*nb/n
+    m2 = m2a + m2b + delta**2*na*nb/n
+    m3 = m3a + m3b + delta**3*na*nb*(na - nb)/n**2 + 3*delta*(na*m2b - nb*m2a)/n
+    m4 = (m4a + m4b + delta**4*na*nb*(na*na - na*nb + nb*nb)/n**3
+          + 6*delta**2*(na*na*m2b + nb*nb*m2a)/n**2 + 4*delta*(na*m3b - nb*m3a)/n)
+    return (n, mean, m2, m3, m4)
+
+
+def _runs(values):
+    """Return (run values, run lengths) for consecutive exactly-equal values (NaN never repeats)."""
+    if values.size == 0:
+        return values, np.zeros(0, dtype='int64')
+    starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [values.size])))
+    return values[starts], lengths
+
+
+def _reduce_chunk(path, start, end, lower_cutoff, upper_cutoff, keep_samples, keep_values):
+    """Parse one chunk and reduce it to partial moments, an exact value-count quantile sketch and its repeat runs."""
+    values = _read_chunk(path, start, end)
+    keep, cutoff_counts = cutoff_mask(values, lower_cutoff, upper_cutoff)
+    kept = values[keep]
+    uniques, counts = np.unique(kept, return_counts=True)
+    run_values, run_lengths = _runs(values)
+    return {'rows': values.size,
+            'cutoff_counts': cutoff_counts,
+            'moments': _moments(kept),
+            'min': kept.min() if kept.size else np.nan,
+            'max': kept.max() if kept.size else np.nan,
+            'uniques': uniques,
+            'counts': counts,
+            'run_values': run_values,
+            'run_lengths': run_lengths,
+            'samples': kept if keep_samples else None,
+            'values': values if keep_values else None}
+
+
+def _stitch_runs(chunks, threshold):
+    """Join the repeat runs of consecutive chunks and return [value, repeats] for runs with more than threshold repeats.
+
+    Repeats are counted as in the original treatment time loop: a run of L equal rows has L - 1 repeats.
+    """
+    long_runs = []
+    open_value, open_length = None, 0
+    for chunk in chunks:
+        for value, length in zip(chunk['run_values'], chunk['run_lengths']):
+            if open_length and value == open_value: #run continues across the chunk boundary
+                open_length += length
+                continue
+            if open_length and open_length - 1 > threshold:
+                long_runs.append([open_value, open_length - 1])
+            open_value, open_length = value, length
+    if open_length and open_length - 1 > threshold:
+        long_runs.append([open_value, open_length - 1])
+    return long_runs
+
+
+def _sketch_value(uniques, cumcounts, rank):
+    """Return the value at 0-based sorted position rank from a value-count sketch."""
+    return uniques[np.searchsorted(cumcounts, rank, side='right')]
+
+
+def _sketch_quantile(uniques, cumcounts, n, q):
+    """Linear-interpolation quantile (numpy default method) from a value-count sketch."""
+    h = (n - 1)*q
+    lo = math.floor(h)
+    t = h - lo
+    a = _sketch_value(uniques, cumcounts, lo)
+    b = _sketch_value(uniques, cumcounts, min(lo + 1, n - 1))
+    if t >= 0.5: #same lerp as numpy for identical rounding
+        return b - (b - a)*(1 - t)
+    return a + (b - a)*t
+
+
+##### ARTIFACT FILTER BELOW #####
+def hampel_outliers(values, window=21, threshold=3.0, min_dev=0.0, block_rows=hampel_block):
+    """Return a boolean mask of the samples flagged as artifacts by a Hampel (rolling median) filter.
+
+    Each sample is compared to the median of the centred window of window samples around it (an even window is widened
+    by one) and flagged when it differs from that median by more than threshold scaled MADs of the window and by more
+    than min_dev, so that flat stretches (MAD of 0) do not flag small steps. The first and last window//2 samples are
+    never flagged. Windows are strided views of values reduced block_rows at a time, so no per-sample Python runs.
+    """
+    values = np.asarray(values, dtype='float64')
+    half = window//2
+    flagged = np.zeros(values.size, dtype=bool)
+    if half == 0 or values.size < 2*half + 1:
+        return flagged
+    windows = sliding_window_view(values, 2*half + 1) #row j is centred on sample j + half
+    for start in range(0, windows.shape[0], block_rows):
+        block = windows[start:start + block_rows]
+        median = np.partition(block, half, axis=1)[:, half] #odd window: the median is the middle order statistic
+        mad = np.partition(np.abs(block - median[:, None]), half, axis=1)[:, half]
+        centre = values[start + half:start + half + block.shape[0]]
+        limit = np.maximum(threshold*mad_scale*mad, min_dev)
+        flagged[start + half:start + half + block.shape[0]] = np.abs(centre - median) > limit
+    return flagged
+
+
+##### DAY STATISTICS BELOW #####
+def _zero_fperr(x):
+    """Treat floating point residue as zero, as pandas does for skew and kurtosis."""
+    return 0.0 if abs(x) < 1e-14 else x
+
+
+def _shape_stats(n, m2, m3, m4):
+    """Return (skew, kurtosis) from central moment sums with the sample-size adjustments used by pandas."""
+    m2, m3, m4 = _zero_fperr(m2), _zero_fperr(m3), _zero_fperr(m4)
+    if n < 3:
+        skew = np.nan
+    elif m2 == 0:
+        skew = 0.0
+    else:
+        skew = (n*(n - 1)**0.5/(n - 2))*(m3/m2**1.5)
+    if n < 4:
+        kurtosis = np.nan
+    else:
+        denominator = _zero_fperr((n - 2)*(n - 3)*m2**2)
+        if denominator == 0:
+            kurtosis = 0.0
+        else:
+            kurtosis = n*(n + 1)*(n - 1)*m4/denominator - 3*(n - 1)**2/((n - 2)*(n - 3))
+    return skew, kurtosis
+
+
+def pressure_stats(kept):
+    """Return the pressure statistics of an array of cutoff-filtered values, computed as the pandas reductions do.
+
+    Returns a dict of count, min, max, mean, median, skew, kurtosis (excess), sd (sample), Q1 and Q3 (linear).
+    """
+    kept = np.asarray(kept, dtype='float64')
+    n = kept.size
+    if n == 0:
+        return {'count': 0, 'min': np.nan, 'max': np.nan, 'mean': np.nan, 'median': np.nan, 'skew': np.nan,
+                'kurtosis': np.nan, 'sd': np.nan, 'Q1': np.nan, 'Q3': np.nan}
+    mean = kept.sum()/n
+    dev = kept - mean
+    dev2 = dev*dev
+    m2 = dev2.sum()
+    skew, kurtosis = _shape_stats(n, m2, (dev2*dev).sum(), (dev2*dev2).sum())
+    q1, q3 = np.quantile(kept, [0.25, 0.75])
+    return {'count': n, 'min': kept.min(), 'max': kept.max(), 'mean': mean, 'median': np.median(kept),
+            'skew': skew, 'kurtosis': kurtosis, 'sd': math.sqrt(m2/(n - 1)) if n > 1 else np.nan, 'Q1': q1, 'Q3': q3}
+
+
+def segment_shape_stats(n, m2, m3, m4):
+    """Vectorized _shape_stats over arrays of segment sizes and central moment sums."""
+    m2, m3, m4 = [np.where(np.abs(m) < 1e-14, 0.0, m) for m in (m2, m3, m4)]
+    n = n.astype('float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skew = np.where(m2 == 0, 0.0, (n*(n - 1)**0.5/(n - 2))*(m3/m2**1.5))
+        denominator = (n - 2)*(n - 3)*m2**2
+        denominator = np.where(np.abs(denominator) < 1e-14, 0.0, denominator)
+        kurtosis = np.where(denominator == 0, 0.0,
+                            n*(n + 1)*(n - 1)*m4/denominator - 3*(n - 1)**2/((n - 2)*(n - 3)))
+    return np.where(n < 3, np.nan, skew), np.where(n < 4, np.nan, kurtosis)
+
+
+def _segment_quantile(ordered, starts, n, q):
+    """Linear-interpolation quantile (numpy default method) of each sorted segment of ordered."""
+    h = (n - 1)*q
+    lo = np.floor(h).astype('int64')
+    t = h - lo
+    a = ordered[starts + lo]
+    b = ordered[starts + np.minimum(lo + 1, n - 1)]
+    return np.where(t >= 0.5, b - (b - a)*(1 - t), a + (b - a)*t) #same lerp as numpy for identical rounding
+
+
+def _segment_block_stats(kept, n, overwrite=False):
+    """Return a dict of arrays with the statistics of the consecutive non-empty segments of sizes n in kept."""
+    starts = np.cumsum(n) - n
+    mean = np.add.reduceat(kept, starts)/n
+    order = np.argsort(kept) #one segmented sort: all values, then a stable (radix) sort of their day numbers
+    day = np.repeat(np.arange(n.size, dtype=np.min_scalar_type(n.size)), n)[order]
+    values = kept[order]
+    del order
+    order = np.argsort(day, kind='stable')
+    del day
+    ordered = np.take(values, order, out=kept if overwrite else None, mode='clip') #'raise' would buffer out
+    del values, order
+    middle = starts + n//2
+    stats = {'min': ordered[starts], 'max': ordered[starts + n - 1], 'mean': mean,
+             'median': np.where(n % 2 == 1, ordered[middle], (ordered[middle - 1] + ordered[middle])/2),
+             'Q1': _segment_quantile(ordered, starts, n, 0.25), 'Q3': _segment_quantile(ordered, starts, n, 0.75)}
+    dev = ordered #the sorted copy is reused, temporaries are updated in place, at most two of the size of kept exist
+    dev2 = np.repeat(mean, n)
+    np.subtract(dev, dev2, out=dev)
+    np.multiply(dev, dev, out=dev2)
+    m2 = np.add.reduceat(dev2, starts)
+    m3 = np.add.reduceat(np.multiply(dev, dev2, out=dev), starts)
+    m4 = np.add.reduceat(np.multiply(dev2, dev2, out=dev2), starts)
+    del dev, dev2
+    stats['skew'], stats['kurtosis'] = segment_shape_stats(n, m2, m3, m4)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['sd'] = np.where(n > 1, np.sqrt(m2/(n - 1)), np.nan)
+    return stats
+
+
+def segment_pressure_stats(kept, counts, block_rows=segment_block, overwrite=False):
+    """Return the pressure statistics of every day of a subject at once, as a dict of arrays keyed as pressure_stats.
+
+    kept holds the cutoff-filtered values of all days back to back and counts the number of values of each day. Sums and
+    moments are segmented reductions (np.add.reduceat) and quartiles come from one segmented sort (by value, then day),
+    so a block of consecutive days totalling up to block_rows values (far above a typical subject; the cap only bounds
+    temporaries for weeks of recording) takes a handful of NumPy calls. With overwrite, kept is reused as the buffer of
+    the sorted values (saving one copy) and its contents are lost. Days without values get NaN statistics. Segmented
+    sums add values in a different order than a whole-array sum, so results can differ from pressure_stats in the last
+    bit.
+    """
+    kept = np.asarray(kept, dtype='float64')
+    counts = np.asarray(counts, dtype='int64')
+    stats = {key: np.full(counts.size, np.nan) for key in ('min', 'max', 'mean', 'median', 'skew', 'kurtosis', 'sd',
+                                                            'Q1', 'Q3')}
+    stats['count'] = counts
+    days = np.flatnonzero(counts) #reduceat cannot reduce empty segments, they are left as NaN
+    n = counts[days]
+    ends = np.cumsum(n)
+    first = 0
+    while first < days.size:
+        begin = ends[first] - n[first]
+        last = max(int(np.searchsorted(ends, begin + block_rows, side='right')), first + 1)
+        block = _segment_block_stats(kept[begin:ends[last - 1]], n[first:last], overwrite)
+        for key in block:
+            stats[key][days[first:last]] = block[key]
+        first = last
+    return stats
+
+
+def long_repeat_runs(values, threshold=repeat_rows):
+    """Return [value, repeats] for each run of consecutive equal values with more than threshold repeats.
+
+    Repeats are counted as in the original treatment time loop: a run of L equal rows has L - 1 repeats.
+    """
+    run_values, run_lengths = _runs(np.asarray(values, dtype='float64'))
+    long = run_lengths - 1 > threshold
+    return [[value, int(length) - 1] for value, length in zip(run_values[long], run_lengths[long])]
+
+
+##### TREATMENT SESSIONS BELOW #####
+def treatment_sessions(values, lower_cutoff, upper_cutoff, idle_low, idle_high, gap_sec=30, min_sec=10,
+                       part_starts=()):
+    """Split one day of pressure values into treatment sessions and return their per-session statistics.
+
+    A row is active when it is not empty (NaN) and not idle (within idle_low/idle_high of 0). Active spans separated by
+    fewer than gap_sec seconds of idle or empty rows belong to the same session, and sessions shorter than min_sec are
+    dropped. part_starts lists the rows where each part after the first begins in a merged day: parts may be recorded
+    hours apart, so every part boundary ends the current session (a forced gap) even when both sides are active.
+    Pressure statistics use the active rows within the cutoffs. Returns a dict of arrays: start_sec (seconds from the
+    first row of the merged day, not from the start of the recording of a part), duration_sec, active_sec, count, mean,
+    max and sd (one entry per session).
+    """
+    values = np.asarray(values, dtype='float64')
+    active = ~np.isnan(values) & ~((values >= idle_low) & (values <= idle_high))
+    part_starts = np.asarray(part_starts, dtype='int64')
+    part_starts = part_starts[(part_starts > 0) & (part_starts < values.size)]
+    edges = np.diff(np.concatenate(([0], active.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) #first row of each active span
+    ends = np.flatnonzero(edges == -1) #row after the last row of each active span
+    crossing = part_starts[active[part_starts] & active[part_starts - 1]] #active spans running across a part boundary
+    if crossing.size != 0: #are split there
+        starts = np.sort(np.concatenate((starts, crossing)))
+        ends = np.sort(np.concatenate((ends, crossing)))
+    if starts.size != 0:
+        new_session = (starts[1:] - ends[:-1]) >= gap_sec*rows_per_sec
+        if part_starts.size != 0: #a part boundary between two spans (ends[i] <= boundary <= starts[i+1]) is a forced gap
+            new_session |= (np.searchsorted(part_starts, starts[1:], side='right')
+                            > np.searchsorted(part_starts, ends[:-1], side='left'))
+        starts = starts[np.concatenate(([True], new_session))]
+        ends = ends[np.concatenate((new_session, [True]))]
+        long_enough = (ends - starts) >= min_sec*rows_per_sec
+        starts, ends = starts[long_enough], ends[long_enough]
+    if starts.size == 0:
+        empty = np.zeros(0)
+        return {'start_sec': empty, 'duration_sec': empty, 'active_sec': empty, 'count': empty.astype('int64'),
+                'mean': empty, 'max': empty, 'sd': empty}
+    kept = active & (values > lower_cutoff) & (values < upper_cutoff)
+    shift = values[kept].mean() if kept.any() else 0.0 #shifted sums keep the one-pass variance accurate
+    shifted = np.where(kept, values - shift, 0.0)
+    bounds = np.stack((starts, ends), axis=1).ravel() #segmented reductions over [start, end) of every session
+    reduce = lambda ufunc, x, fill: ufunc.reduceat(np.concatenate((x, [fill])), bounds)[::2] #pad so end == len is valid
+    active_rows = reduce(np.add, active.astype('int64'), 0)
+    count = reduce(np.add, kept.astype('int64'), 0)
+    total = reduce(np.add, shifted, 0.0)
+    total_sq = reduce(np.add, shifted*shifted, 0.0)
+    peak = reduce(np.maximum, np.where(kept, values, -np.inf), -np.inf)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total/count
+        variance = (total_sq - total*mean)/(count - 1)
+    return {'start_sec': starts/rows_per_sec,
+            'duration_sec': (ends - starts)/rows_per_sec,
+            'active_sec': active_rows/rows_per_sec,
+            'count': count,
+            'mean': np.where(count > 0, mean + shift, np.nan),
+            'max': np.where(count > 0, peak, np.nan),
+            'sd': np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)}
+
+
+##### LARGE DAY STATISTICS BELOW #####
+def chunked_day_stats(path, lower_cutoff, upper_cutoff, n_workers=None, chunks_per_worker=4, keep_samples=False,
+                      keep_values=False, threshold=repeat_rows):
+    """Compute the pressure statistics and repeat runs of one merged day by parsing it in parallel chunks.
+
+    Statistics use the same definitions as the pandas reductions of the analysis script (sample SD, adjusted skew and
+    excess kurtosis, linear quartiles), so the combined result equals a single-threaded pass. Threads are used since
+    parsing and NumPy reductions release the GIL and the analysis script cannot be re-imported by worker processes.
+    Returns a dict of min, max, mean, median, skew, kurtosis, sd, Q1, Q3, count (kept), below, above, nan, rows,
+    long_runs, samples (cutoff-filtered values, if keep_samples) and values (all values, if keep_values).
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    offsets = chunk_offsets(path, n_workers*chunks_per_worker)
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        chunks = list(pool.map(lambda se: _reduce_chunk(path, se[0], se[1], lower_cutoff, upper_cutoff, keep_samples,
+                                                        keep_values), offsets))
+    moments = (0, 0.0, 0.0, 0.0, 0.0)
+    for chunk in chunks:
+        moments = _combine_moments(moments, chunk['moments'])
+    n, mean, m2, m3, m4 = moments
+    result = {'count': n, 'rows': sum(chunk['rows'] for chunk in chunks),
+              'below': sum(chunk['cutoff_counts']['below'] for chunk in chunks),
+              'above': sum(chunk['cutoff_counts']['above'] for chunk in chunks),
+              'nan': sum(chunk['cutoff_counts']['nan'] for chunk in chunks),
+              'long_runs': _stitch_runs(chunks, threshold),
+              'samples': np.concatenate([chunk['samples'] for chunk in chunks]) if keep_samples and chunks else None,
+              'values': np.concatenate([chunk['values'] for chunk in chunks]) if keep_values and chunks else None}
+    if n == 0:
+        result.update({'min': np.nan, 'max': np.nan, 'mean': np.nan, 'median': np.nan, 'skew': np.nan,
+                       'kurtosis': np.nan, 'sd': np.nan, 'Q1': np.nan, 'Q3': np.nan})
+        return result
+    uniques, inverse = np.unique(np.concatenate([chunk['uniques'] for chunk in chunks]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([chunk['counts'] for chunk in chunks])).astype('int64')
+    cumcounts = np.cumsum(counts)
+    if n % 2: #median as np.median: middle value, or mean of the two middle values
+        median = _sketch_value(uniques, cumcounts, n//2)
+    else:
+        median = (_sketch_value(uniques, cumcounts, n//2 - 1) + _sketch_value(uniques, cumcounts, n//2))/2
+    skew, kurtosis = _shape_stats(n, m2, m3, m4)
+    result.update({'min': min(chunk['min'] for chunk in chunks if chunk['moments'][0]),
+                   'max': max(chunk['max'] for chunk in chunks if chunk['moments'][0]),
+                   'mean': mean, 'median': median, 'skew': skew, 'kurtosis': kurtosis,
+                   'sd': math.sqrt(m2/(n - 1)) if n > 1 else np.nan,
+                   'Q1': _sketch_quantile(uniques, cumcounts, n, 0.25),
+                   'Q3': _sketch_quantile(uniques, cumcounts, n, 0.75)})
+    return result
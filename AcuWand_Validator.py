@@ -11,9 +11,9 @@ used by 'AcuWand Analysis.' A log .txt file is produced that flags .csv files th
 ##### IMPORT BELOW #####
 from os.path import join as pathjoin
 from os.path import sep
-from glob import glob
 import datetime
 import re
+from AcuWand_Tools import glob_data, glob_folders, not_folders
 
 __author__ = "Noah C Waller"
 __copyright__ = "Copyright Pending"
@@ -57,17 +57,24 @@ logfile.write('\n'+'\n'+'##############################'+"\n"+
 logfile.close()
 
 
-T_list = glob(pathjoin(data_dir, 'T*')) #grab list of all T# directories
+T_list = glob_folders(data_dir, 'T*') #grab list of all T# directories (and zipped T# folders)
+for path in not_folders(data_dir, 'T*'): #e.g. a damaged T#.zip or a stray T# file
+    logfile = open(pathjoin(log_dir,logfilename),'a')
+    logfile.write('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+    logfile.close()
 for folder in T_list:
     T_ID = folder.split('/')[-1]
-    subjects_list = glob(pathjoin(data_dir, T_ID, 'BPCR01*')) #create subject list
-    subjects_list.sort()
+    subjects_list = glob_folders(pathjoin(data_dir, T_ID), 'BPCR01*') #create subject list (incl. zipped ones)
+    for path in not_folders(pathjoin(data_dir, T_ID), 'BPCR01*'):
+        logfile = open(pathjoin(log_dir,logfilename),'a')
+        logfile.write('Not a Folder or Zipped Folder: '+path+'... skipping.'+'\n'+'\n')
+        logfile.close()
     for subject_dir in subjects_list:
-        day_list_total = glob(pathjoin(subject_dir, '*.csv'))
+        day_list_total = glob_data(subject_dir, '*.csv') #includes .csv.gz/.bz2/.xz files and .csv members of .zip archives
         ###
-        day_list_format1_check = glob(pathjoin(subject_dir, '*'+'_'+'*'+'_'+'*'+'-'+'*'+'-'+'*'+'_'+'*'+'_'+'*.csv')) #reads .csv file in Format 1
-        day_list_format2_check = glob(pathjoin(subject_dir, '*'+'_'+'*'+'___'+'*'+'-'+'*'+'-'+'*'+'___'+'*'+'___'+'*'+'_'+'*.csv')) #reads .csv file in Format 2
-        day_list_format3_check = glob(pathjoin(subject_dir, '*'+T_ID+'_'+'*'+'-'+'*'+'-'+'*.csv')) #reads .csv file in Format 3
+        day_list_format1_check = glob_data(subject_dir, '*'+'_'+'*'+'_'+'*'+'-'+'*'+'-'+'*'+'_'+'*'+'_'+'*.csv') #reads .csv file in Format 1
+        day_list_format2_check = glob_data(subject_dir, '*'+'_'+'*'+'___'+'*'+'-'+'*'+'-'+'*'+'___'+'*'+'___'+'*'+'_'+'*.csv') #reads .csv file in Format 2
+        day_list_format3_check = glob_data(subject_dir, '*'+T_ID+'_'+'*'+'-'+'*'+'-'+'*.csv') #reads .csv file in Format 3
         
         if len(day_list_format3_check) != 0: #as Format 3 is most stringent, start here: if there is data for given subject, assign Format 3
             format_style = 3 #assign Format 3